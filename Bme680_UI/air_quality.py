@@ -0,0 +1,136 @@
+"""Gas baseline and air quality estimate for the BME680."""
+import ustruct as struct
+
+from usr import constants
+
+
+class AirQuality:
+    """Online gas resistance baseline and humidity compensated air quality score.
+
+    Gas resistance rises in clean air and drops with volatile compounds, so the
+    baseline is an exponentially weighted moving average that follows higher
+    readings quickly (rise) and lower readings slowly (fall). Memory and work
+    per sample are constant, no history is kept.
+
+    The score runs from 0 (bad) to 100 (good). By default 75% of it comes from
+    the gas resistance relative to the baseline and 25% from the distance of the
+    humidity to hum_baseline.
+
+    The baseline is saved every save_every samples and loaded on start, so a
+    restart does not need a new burn-in.
+
+    :param path: Baseline file, None to keep the baseline in RAM only
+    :param burn_in: Samples before a score is reported
+    :param rise: Weight of a reading above the baseline, 0 to 1
+    :param fall: Weight of a reading below the baseline, 0 to 1
+    :param save_every: Samples between baseline saves
+    :param hum_baseline: Ideal relative humidity in %
+    :param hum_weighting: Share of the humidity in the score, 0 to 1
+
+    """
+
+    def __init__(self, path=constants.BASELINE_PATH, burn_in=300, rise=0.1, fall=0.001,
+                 save_every=720, hum_baseline=40.0, hum_weighting=0.25):  # noqa D107
+        self.path = path
+        self.burn_in = burn_in
+        self.rise = rise
+        self.fall = fall
+        self.save_every = save_every
+        self.hum_baseline = hum_baseline
+        self.hum_weighting = hum_weighting
+        # Baseline gas resistance in Ohms
+        self.baseline = None
+        # Samples folded into the baseline, capped at burn_in
+        self.samples = 0
+        # Latest score, None during the burn-in
+        self.score = None
+        self._since_save = 0
+        if path is not None:
+            self.load()
+
+    def ready(self):
+        """Return True once the burn-in is complete."""
+        return self.samples >= self.burn_in
+
+    def update(self, data):
+        """Fold a reading into the baseline and return the air quality score.
+
+        Readings without a gas resistance or a stable heater are ignored.
+
+        :param data: FieldData, usually BME680.data after a successful read
+        :return: Score from 0 to 100, or None during the burn-in
+
+        """
+        gas = data.gas_resistance
+        if gas is None or not data.heat_stable:
+            return self.score
+
+        baseline = self.baseline
+        if baseline is None:
+            baseline = gas
+        elif gas > baseline:
+            baseline += (gas - baseline) * self.rise
+        else:
+            baseline += (gas - baseline) * self.fall
+        self.baseline = baseline
+
+        if self.samples < self.burn_in:
+            self.samples += 1
+        self._since_save += 1
+        if self.path is not None and self._since_save >= self.save_every:
+            self.save()
+
+        if self.samples < self.burn_in:
+            self.score = None
+        else:
+            self.score = self._score(gas, data.humidity)
+        return self.score
+
+    def _score(self, gas, humidity):
+        hum_weighting = self.hum_weighting
+        if humidity is None:
+            hum_weighting = 0.0
+        gas_weighting = 1.0 - hum_weighting
+
+        gas_score = gas_weighting * 100.0
+        if gas < self.baseline:
+            gas_score *= gas / self.baseline
+        if not hum_weighting:
+            return gas_score
+
+        hum_baseline = self.hum_baseline
+        offset = humidity - hum_baseline
+        if offset > 0:
+            hum_score = (100.0 - hum_baseline - offset) / (100.0 - hum_baseline)
+        else:
+            hum_score = (hum_baseline + offset) / hum_baseline
+        hum_score = min(max(hum_score, 0.0), 1.0) * hum_weighting * 100.0
+        return gas_score + hum_score
+
+    def load(self):
+        """Load the baseline file. Returns True if it was valid."""
+        try:
+            with open(self.path, 'rb') as f:
+                blob = f.read()
+        except OSError:
+            return False
+        if len(blob) != struct.calcsize(constants.BASELINE_FMT):
+            return False
+        magic, baseline, samples = struct.unpack(constants.BASELINE_FMT, blob)
+        if magic != constants.BASELINE_MAGIC or not baseline > 0:
+            return False
+        self.baseline = baseline
+        self.samples = min(samples, self.burn_in)
+        return True
+
+    def save(self):
+        """Write the baseline file, for example before a restart."""
+        self._since_save = 0
+        if self.baseline is None:
+            return
+        try:
+            with open(self.path, 'wb') as f:
+                f.write(struct.pack(constants.BASELINE_FMT, constants.BASELINE_MAGIC,
+                                    self.baseline, min(self.samples, 0xffff)))
+        except OSError:
+            pass
@@ -1,22 +1,33 @@
 """BME680 Temperature, Pressure, Humidity & Gas Sensor."""
-import math
+import gc
 from uerrno import ENODEV
 
 import utime as time
+import ustruct as struct
 
 from . import constants
-from usr.constants import BME680Data, lookupTable1, lookupTable2
+from usr.constants import BME680Data, FieldDataPool, RawFrameBuffer, ReadStats, SensorConfig
 
 __version__ = '2.0.0'
 
+# Built by _get_gas_lookup_tables() the first time gas is compensated
+_gas_lookup_tables = None
 
-# Export constants to global namespace
-# so end-users can "from BME680 import NAME"
-if hasattr(constants, '__dict__'):
-    for key in constants.__dict__:
-        value = constants.__dict__[key]
-        if key not in globals():
-            globals()[key] = value
+
+def _get_gas_lookup_tables():
+    """Get lookupTable1 and lookupTable2, followed by both split at bit 16.
+
+    The split halves let the small-int compensation multiply them without
+    building bignums.
+
+    """
+    global _gas_lookup_tables
+    if _gas_lookup_tables is None:
+        table1, table2 = constants.gas_lookup_tables()
+        _gas_lookup_tables = (table1, table2,
+                              tuple(v >> 16 for v in table1), tuple(v & 0xffff for v in table1),
+                              tuple(v >> 16 for v in table2), tuple(v & 0xffff for v in table2))
+    return _gas_lookup_tables
 
 
 class BME680(BME680Data):
@@ -29,44 +40,91 @@ class BME680(BME680Data):
 
     """
 
-    def __init__(self, i2c, i2c_addr=constants.I2C_ADDR_PRIMARY):
+    def __init__(self, i2c, i2c_addr=constants.I2C_ADDR_PRIMARY, config=None,
+                 calib_cache=constants.CALIB_CACHE_PATH, compensation=constants.COMPENSATION_INT):
         """Initialise BME680 sensor instance and verify device presence.
 
         :param i2c_addr: i2c address of BME680
         :param i2c_device: Optional SMBus-compatible instance for i2c transport
-        
+        :param config: Optional SensorConfig, defaults to SensorConfig()
+        :param calib_cache: Calibration cache path, formatted with the chip variant
+            and i2c address. None always reads the calibration from the chip.
+        :param compensation: COMPENSATION_INT or COMPENSATION_SMALL_INT
 
         """
+        # Raw capture ring buffer, see set_raw_capture()
+        self._raw_frames = None
+        # True when the latest raw frame has not been compensated into .data yet
+        self._raw_dirty = False
         BME680Data.__init__(self)
+        # Every measurement is decoded into the next pooled record, which is
+        # then published as .data
+        self._pool = FieldDataPool()
+        self._data = self._pool.records[0]
         self._i2c = i2c
         self.i2c_addr = i2c_addr
-    
+        self._calib_cache = calib_cache
+        if compensation == constants.COMPENSATION_SMALL_INT:
+            self._calc_temperature = self._calc_temperature_small
+            self._calc_pressure = self._calc_pressure_small
+            self._calc_humidity = self._calc_humidity_small
+            self._calc_gas_resistance_high = self._calc_gas_resistance_high_small
+            self._calc_gas_resistance_low = self._calc_gas_resistance_low_small
+        elif compensation != constants.COMPENSATION_INT:
+            raise ValueError('Invalid compensation.')
+        # True between trigger() and the collect() that picks up its result
+        self._pending = False
+        # ticks_ms() after which the pending conversion counts as timed out
+        self._deadline = 0
+        # Shadow copy of the configuration registers CONF_HEAT_CTRL_ADDR..CONF_ODR_FILT_ADDR,
+        # so field updates are write-only. The mode bits are always kept at SLEEP_MODE.
+        self._shadow = bytearray(constants.REG_BUFFER_LENGTH)
+        # Preallocated I/O buffers, so the sampling path does not allocate
+        self._addr_buf = bytearray(1)
+        self._byte_buf = bytearray(1)
+        self._field_buf = bytearray(constants.FIELD_LENGTH)
+        # Heater sequencing, see configure(). trigger() writes ctrl_gas_1 and
+        # ctrl_meas together from _trigger_buf while a sequence is active.
+        self._heater_sequence = None
+        self._heater_step = 0
+        self._trigger_buf = bytearray(3)
+        # Parallel mode state, allocated by the first start_parallel()
+        self._parallel_buf = None
+        # Records published by the latest collect_parallel(), oldest first
+        self.parallel_data = None
+        # When True, get_sensor_data() and collect() store the heap bytes they
+        # allocated in .last_alloc
+        self.alloc_trace = False
+        self.last_alloc = None
+        # Outcome counters of measure(), get_sensor_data() and collect()
+        self.stats = ReadStats()
         if self._i2c is None:
            raise ValueError("I2C interface must be passed explicitly in QuecPython")
-        self._variant = self._get_regs(constants.CHIP_VARIANT_ADDR, 1)
+        variant = self._get_regs(constants.CHIP_VARIANT_ADDR, 1)
+        self._variant = variant[0] if variant else constants.VARIANT_LOW
 
+        # The sensor comes out of reset in SLEEP_MODE with all configuration
+        # registers cleared, which also fills in the shadow copy.
         self.soft_reset()
-        self.set_power_mode(constants.SLEEP_MODE)
 
         self._get_calibration_data()
 
-        self.set_humidity_oversample(constants.OS_2X)
-        self.set_pressure_oversample(constants.OS_4X)
-        self.set_temperature_oversample(constants.OS_8X)
-        self.set_filter(constants.FILTER_SIZE_3)
-        if self._variant == constants.VARIANT_HIGH:
-            self.set_gas_status(constants.ENABLE_GAS_MEAS_HIGH)
-        else:
-            self.set_gas_status(constants.ENABLE_GAS_MEAS_LOW)
         self.set_temp_offset(0)
-        self.get_sensor_data()
-   
-   
+        self.configure(config if config is not None else SensorConfig())
 
 
     def _get_calibration_data(self):
-    #"""Retrieve the sensor calibration data and store it in .calibration_data."""
+        """Retrieve the sensor calibration data and store it in .calibration_data.
 
+        Reuses the calibration cache when it is valid for this chip,
+        otherwise reads the chip and rewrites the cache.
+
+        """
+        path = None
+        if self._calib_cache is not None:
+            path = self._calib_cache.format(self._variant, self.i2c_addr)
+            if self._load_calibration_cache(path):
+                return
 
         calibration = self._get_regs(constants.COEFF_ADDR1, constants.COEFF_ADDR1_LEN)
         calibration2 = self._get_regs(constants.COEFF_ADDR2, constants.COEFF_ADDR2_LEN)
@@ -85,12 +143,163 @@ class BME680(BME680Data):
         self.calibration_data.set_from_array(calibration)
         self.calibration_data.set_other(heat_range, heat_value, sw_error)
 
+        if path is not None:
+            self._save_calibration_cache(path)
+
+    def _calibration_cache_key(self):
+        return constants.CALIB_CACHE_MAGIC + bytes([self._variant, self.i2c_addr])
+
+    def _load_calibration_cache(self, path):
+        """Load .calibration_data from the cache file. Returns True if it is valid for this chip."""
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+        except OSError:
+            return False
+
+        key = self._calibration_cache_key()
+        size = struct.calcsize(constants.CALIB_CACHE_FMT)
+        if len(blob) != len(key) + size + 2 or blob[:len(key)] != key:
+            return False
+        payload = blob[len(key):len(key) + size]
+        if sum(payload) & 0xffff != blob[-2] | (blob[-1] << 8):
+            return False
+        self.calibration_data.set_from_bytes(payload)
+
+        # par_t1 differs between parts, so a single 2-byte read catches a swapped sensor
+        t1_addr = constants.COEFF_ADDR2 + constants.T1_LSB_REG - constants.COEFF_ADDR1_LEN
+        t1 = self._get_regs(t1_addr, 2)
+        if not t1 or len(t1) < 2:
+            return False
+        return constants.bytes_to_word(t1[1], t1[0]) == self.calibration_data.par_t1
+
+    def _save_calibration_cache(self, path):
+        payload = self.calibration_data.to_bytes()
+        checksum = sum(payload) & 0xffff
+        try:
+            with open(path, 'wb') as f:
+                f.write(self._calibration_cache_key() + payload + bytes([checksum & 0xff, checksum >> 8]))
+        except OSError:
+            pass
+
 
 
     def soft_reset(self):
         """Trigger a soft reset."""
         self._set_regs(constants.SOFT_RESET_ADDR, constants.SOFT_RESET_CMD)
         time.sleep(constants.RESET_PERIOD / 1000.0)
+        # The configuration registers all reset to zero
+        for i in range(constants.REG_BUFFER_LENGTH):
+            self._shadow[i] = 0
+        self._pending = False
+
+    def refresh(self):
+        """Re-read the configuration registers from the device.
+
+        Updates the shadow copy used by the set_* and get_* methods,
+        as well as .tph_settings and .gas_settings. Returns True upon success.
+
+        """
+        regs = self._get_regs(constants.CONF_HEAT_CTRL_ADDR, constants.REG_BUFFER_LENGTH)
+        if not regs or len(regs) < constants.REG_BUFFER_LENGTH:
+            return False
+
+        for i in range(constants.REG_BUFFER_LENGTH):
+            self._shadow[i] = regs[i]
+        self._shadow[constants.REG_TEMP_INDEX] &= ~constants.MODE_MSK & 0xff
+
+        self.tph_settings.os_hum = self.get_humidity_oversample()
+        self.tph_settings.os_pres = self.get_pressure_oversample()
+        self.tph_settings.os_temp = self.get_temperature_oversample()
+        self.tph_settings.filter = self.get_filter()
+        self.gas_settings.nb_conv = self.get_gas_heater_profile()
+        self.gas_settings.heatr_ctrl = self.get_gas_heater_status()
+        self.gas_settings.run_gas = self.get_gas_status()
+        return True
+
+    def configure(self, config):
+        """Apply a SensorConfig in one I2C write transaction.
+
+        All configuration registers, plus the heater registers of the selected
+        profile when a heater temperature and duration are given, are written
+        as address/data pairs in a single burst.
+
+        Channels missing from config.channels get OS_NONE, or gas measurement
+        and the heater switched off, and are left as None in .data.
+
+        With config.heater_profiles, every profile is programmed in the same
+        burst and trigger() selects the next one for each conversion, so
+        .data.gas_index tells which profile a reading used.
+
+        :param config: SensorConfig instance
+
+        """
+        if config.nb_conv > constants.NBCONV_MAX or config.nb_conv < constants.NBCONV_MIN:
+            raise ValueError("Profile '{}' should be between {} and {}".format(config.nb_conv, constants.NBCONV_MIN, constants.NBCONV_MAX))
+        if not config.channels & constants.CHANNELS_ALL:
+            raise ValueError('At least one channel must be selected.')
+        profiles = config.heater_profiles
+        if profiles is not None:
+            if not 0 < len(profiles) <= constants.NBCONV_MAX + 1:
+                raise ValueError('Between 1 and {} heater profiles are supported.'.format(constants.NBCONV_MAX + 1))
+            if config.nb_conv >= len(profiles):
+                raise ValueError("Profile '{}' is not in heater_profiles".format(config.nb_conv))
+
+        channels = config.channels
+        os_hum = config.os_hum if channels & constants.CHANNEL_HUMIDITY else constants.OS_NONE
+        os_pres = config.os_pres if channels & constants.CHANNEL_PRESSURE else constants.OS_NONE
+        os_temp = config.os_temp
+        if os_temp == constants.OS_NONE:
+            # Temperature is needed to compensate every other channel
+            os_temp = constants.OS_1X
+        if channels & constants.CHANNEL_GAS:
+            run_gas = self._resolve_gas_status(config.run_gas)
+            heater = (config.heater & constants.HCTRL_MSK) >> constants.HCTRL_POS
+        else:
+            run_gas = constants.DISABLE_GAS_MEAS
+            heater = (constants.DISABLE_HEATER & constants.HCTRL_MSK) >> constants.HCTRL_POS
+
+        regs = []
+        self._heater_sequence = None
+        if run_gas and profiles is not None:
+            for nb_profile, (heatr_temp, heatr_dur) in enumerate(profiles):
+                regs.append((constants.RES_HEAT0_ADDR + nb_profile,
+                             int(self._calc_heater_resistance(heatr_temp))))
+                regs.append((constants.GAS_WAIT0_ADDR + nb_profile,
+                             self._calc_heater_duration(heatr_dur)))
+            self.gas_settings.heatr_temp, self.gas_settings.heatr_dur = profiles[config.nb_conv]
+            if len(profiles) > 1:
+                self._heater_sequence = tuple(profiles)
+                self._heater_step = config.nb_conv
+        elif run_gas and config.heatr_temp is not None and config.heatr_dur is not None:
+            regs.append((constants.RES_HEAT0_ADDR + config.nb_conv,
+                         int(self._calc_heater_resistance(config.heatr_temp))))
+            regs.append((constants.GAS_WAIT0_ADDR + config.nb_conv,
+                         self._calc_heater_duration(config.heatr_dur)))
+            self.gas_settings.heatr_temp = config.heatr_temp
+            self.gas_settings.heatr_dur = config.heatr_dur
+
+        self._update_shadow(constants.CONF_HEAT_CTRL_ADDR, constants.HCTRL_MSK, constants.HCTRL_POS, heater)
+        self._update_shadow(constants.CONF_ODR_RUN_GAS_NBC_ADDR, constants.RUN_GAS_MSK, constants.RUN_GAS_POS, run_gas)
+        self._update_shadow(constants.CONF_ODR_RUN_GAS_NBC_ADDR, constants.NBCONV_MSK, constants.NBCONV_POS, config.nb_conv)
+        self._update_shadow(constants.CONF_OS_H_ADDR, constants.OSH_MSK, constants.OSH_POS, os_hum)
+        self._update_shadow(constants.CONF_T_P_MODE_ADDR, constants.OST_MSK, constants.OST_POS, os_temp)
+        self._update_shadow(constants.CONF_T_P_MODE_ADDR, constants.OSP_MSK, constants.OSP_POS, os_pres)
+        self._update_shadow(constants.CONF_ODR_FILT_ADDR, constants.FILTER_MSK, constants.FILTER_POS, config.filter)
+
+        # ctrl_hum must be written before ctrl_meas for it to take effect
+        for register in (constants.CONF_HEAT_CTRL_ADDR, constants.CONF_ODR_RUN_GAS_NBC_ADDR,
+                         constants.CONF_OS_H_ADDR, constants.CONF_T_P_MODE_ADDR, constants.CONF_ODR_FILT_ADDR):
+            regs.append((register, self._shadow[register - constants.CONF_HEAT_CTRL_ADDR]))
+        self._set_regs_burst(regs)
+
+        self.tph_settings.os_hum = os_hum
+        self.tph_settings.os_pres = os_pres
+        self.tph_settings.os_temp = os_temp
+        self.tph_settings.filter = config.filter
+        self.gas_settings.run_gas = run_gas
+        self.gas_settings.nb_conv = config.nb_conv
+        self.gas_settings.heatr_ctrl = heater
 
     def set_temp_offset(self, value):
         """Set temperature offset in celsius.
@@ -123,7 +332,7 @@ class BME680(BME680Data):
 
     def get_humidity_oversample(self):
         """Get humidity oversampling."""
-        return (self._get_regs(constants.CONF_OS_H_ADDR, 1) & constants.OSH_MSK) >> constants.OSH_POS
+        return self._get_bits(constants.CONF_OS_H_ADDR, constants.OSH_MSK, constants.OSH_POS)
 
     def set_pressure_oversample(self, value):
         """Set temperature oversampling.
@@ -142,7 +351,7 @@ class BME680(BME680Data):
 
     def get_pressure_oversample(self):
         """Get pressure oversampling."""
-        return (self._get_regs(constants.CONF_T_P_MODE_ADDR, 1) & constants.OSP_MSK) >> constants.OSP_POS
+        return self._get_bits(constants.CONF_T_P_MODE_ADDR, constants.OSP_MSK, constants.OSP_POS)
 
     def set_temperature_oversample(self, value):
         """Set pressure oversampling.
@@ -161,7 +370,7 @@ class BME680(BME680Data):
 
     def get_temperature_oversample(self):
         """Get temperature oversampling."""
-        return (self._get_regs(constants.CONF_T_P_MODE_ADDR, 1) & constants.OST_MSK) >> constants.OST_POS
+        return self._get_bits(constants.CONF_T_P_MODE_ADDR, constants.OST_MSK, constants.OST_POS)
 
     def set_filter(self, value):
         """Set IIR filter size.
@@ -181,59 +390,59 @@ class BME680(BME680Data):
 
     def get_filter(self):
         """Get filter size."""
-        return (self._get_regs(constants.CONF_ODR_FILT_ADDR, 1) & constants.FILTER_MSK) >> constants.FILTER_POS
+        return self._get_bits(constants.CONF_ODR_FILT_ADDR, constants.FILTER_MSK, constants.FILTER_POS)
 
     def select_gas_heater_profile(self, value):
         """Set current gas sensor conversion profile.
 
         Select one of the 10 configured heating durations/set points.
+        While a heater sequence is active, the sequence continues from it.
 
         :param value: Profile index from 0 to 9
 
         """
         if value > constants.NBCONV_MAX or value < constants.NBCONV_MIN:
             raise ValueError("Profile '{}' should be between {} and {}".format(value, constants.NBCONV_MIN, constants.NBCONV_MAX))
+        if self._heater_sequence is not None:
+            if value >= len(self._heater_sequence):
+                raise ValueError("Profile '{}' is not in the heater sequence".format(value))
+            self._heater_step = value
 
         self.gas_settings.nb_conv = value
         self._set_bits(constants.CONF_ODR_RUN_GAS_NBC_ADDR, constants.NBCONV_MSK, constants.NBCONV_POS, value)
 
     def get_gas_heater_profile(self):
-    #"""Get gas sensor conversion profile: 0 to 9."""
-        regs = self._get_regs(constants.CONF_ODR_RUN_GAS_NBC_ADDR, 1)
-        if regs and len(regs) > 0:
-            return regs[0] & constants.NBCONV_MSK
-        return None
+        """Get gas sensor conversion profile: 0 to 9."""
+        return self._get_bits(constants.CONF_ODR_RUN_GAS_NBC_ADDR, constants.NBCONV_MSK, constants.NBCONV_POS)
 
 
     def set_gas_heater_status(self, value):
         """Enable/disable gas heater."""
-        self.gas_settings.heater = value
+        self.gas_settings.heatr_ctrl = value
         self._set_bits(constants.CONF_HEAT_CTRL_ADDR, constants.HCTRL_MSK, constants.HCTRL_POS, value)
 
     def get_gas_heater_status(self):
-    #"""Get current heater status."""
-        regs = self._get_regs(constants.CONF_HEAT_CTRL_ADDR, 1)
-        if regs and len(regs) > 0:
-            return (regs[0] & constants.HCTRL_MSK) >> constants.HCTRL_POS
-        return None
+        """Get current heater status."""
+        return self._get_bits(constants.CONF_HEAT_CTRL_ADDR, constants.HCTRL_MSK, constants.HCTRL_POS)
 
 
     def set_gas_status(self, value):
         """Enable/disable gas sensor."""
-        if value == -1:
-            if self._variant == constants.VARIANT_HIGH:
-                value = constants.ENABLE_GAS_MEAS_HIGH
-            else:
-                value = constants.ENABLE_GAS_MEAS_LOW
+        value = self._resolve_gas_status(value)
         self.gas_settings.run_gas = value
         self._set_bits(constants.CONF_ODR_RUN_GAS_NBC_ADDR, constants.RUN_GAS_MSK, constants.RUN_GAS_POS, value)
 
+    def _resolve_gas_status(self, value):
+        """Map ENABLE_GAS_MEAS to the run gas value for this variant."""
+        if value == constants.ENABLE_GAS_MEAS:
+            if self._variant == constants.VARIANT_HIGH:
+                return constants.ENABLE_GAS_MEAS_HIGH
+            return constants.ENABLE_GAS_MEAS_LOW
+        return value
+
     def get_gas_status(self):
-    #"""Get the current gas status."""
-        regs = self._get_regs(constants.CONF_ODR_RUN_GAS_NBC_ADDR, 1)
-        if regs and len(regs) > 0:
-            return (regs[0] & constants.RUN_GAS_MSK) >> constants.RUN_GAS_POS
-        return None
+        """Get the current gas status."""
+        return self._get_bits(constants.CONF_ODR_RUN_GAS_NBC_ADDR, constants.RUN_GAS_MSK, constants.RUN_GAS_POS)
 
 
     
@@ -285,19 +494,28 @@ class BME680(BME680Data):
         self._set_regs(constants.GAS_WAIT0_ADDR + nb_profile, temp)
 
     def set_power_mode(self, value, blocking=True):
-        if value not in (0, 1):
+        """Set power mode.
+
+        The mode is written on top of the shadowed ctrl_meas value and is not
+        kept in the shadow, since FORCED_MODE falls back to SLEEP_MODE on its own.
+
+        """
+        if value not in (constants.SLEEP_MODE, constants.FORCED_MODE):
+            # PARALLEL_MODE needs the heater profiles, see start_parallel()
             raise ValueError('Invalid power mode.')
 
         self.power_mode = value
-        self._set_bits(0x74, 0x03, 0, value)
+        ctrl_meas = self._shadow[constants.REG_TEMP_INDEX] | (value << constants.MODE_POS)
+        self._set_regs(constants.CONF_T_P_MODE_ADDR, ctrl_meas)
         time.sleep_ms(1)  # Small delay is okay
 
     # FORCED_MODE transitions back to SLEEP_MODE automatically
-        if value == 1:
+        if value == constants.FORCED_MODE:
             return
 
-    # Only loop check if setting SLEEP_MODE (0)
-        if blocking:
+    # Only loop check if a forced conversion may still be running
+        if blocking and self._pending:
+            self._pending = False
             for _ in range(10):
                 current = self.get_power_mode()
                 if current is None:
@@ -311,119 +529,596 @@ class BME680(BME680Data):
 
 
     def get_power_mode(self):
-        result = self._get_regs(0x74, 1)
-        if result and isinstance(result, list) and len(result) > 0:
-            mode = result[0] & 0x03  # Only return the mode bits
+        """Get the current power mode, read from the device."""
+        result = self._read_byte(constants.CONF_T_P_MODE_ADDR)
+        if result is not None:
+            mode = result & constants.MODE_MSK  # Only return the mode bits
             return mode
         return None
 
 
-    def get_sensor_data(self):
-    #"""Get sensor data. Stores data in .data and returns True upon success."""
-    
-        
-        self._set_regs(0x72, 0x01)
+    def trigger(self):
+        """Start a forced-mode conversion and return without waiting for it.
 
-        self._set_regs(0x74, 0x25)
+        Pair with ready() and collect() so one timer tick starts a conversion
+        and the following tick, or a scheduler callback, picks up the result.
+        Returns False if the I2C write failed, which is counted in .stats.
 
-        time.sleep_ms(300)
+        """
+        if self._trigger():
+            return True
+        self.stats.record(constants.E_COM_FAIL)
+        return False
 
-        for attempt in range(10):
+    def _trigger(self):
+        """Start a forced-mode conversion without counting a failed write."""
+        # ctrl_hum is already on the device; it takes effect with this ctrl_meas write
+        ctrl_meas = self._shadow[constants.REG_TEMP_INDEX] | constants.FORCED_MODE
+        if self._heater_sequence is None:
+            ok = self._set_regs(constants.CONF_T_P_MODE_ADDR, ctrl_meas)
+        else:
+            ok = self._select_next_heater_profile(ctrl_meas)
+        self._pending = ok
+        if ok:
+            duration = self.get_profile_duration()
+            # The conversion time is nominal; allow for a slow internal oscillator
+            timeout = duration + (duration >> 2) + constants.READY_TIMEOUT_MARGIN_MS
+            self._deadline = time.ticks_add(time.ticks_ms(), timeout)
+        return ok
 
-            status_list = self._get_regs(constants.FIELD0_ADDR, 1)
-            if not status_list or len(status_list) < 1:
-                continue
+    def _select_next_heater_profile(self, ctrl_meas):
+        """Select the next heater profile of the sequence and start the conversion.
 
-            status = status_list[0]
+        ctrl_gas_1 and ctrl_meas go out as address/data pairs in one write.
 
-            if (status & constants.NEW_DATA_MSK) == 0:
-                time.sleep_ms(100)
-                continue
+        """
+        sequence = self._heater_sequence
+        nb_conv = self._heater_step
+        self._heater_step = (nb_conv + 1) % len(sequence)
 
-            regs = self._get_regs(constants.FIELD0_ADDR, constants.FIELD_LENGTH)
-            if not regs or len(regs) < constants.FIELD_LENGTH:
-                continue
+        buf = self._trigger_buf
+        buf[0] = self._update_shadow(constants.CONF_ODR_RUN_GAS_NBC_ADDR, constants.NBCONV_MSK,
+                                     constants.NBCONV_POS, nb_conv)
+        buf[1] = constants.CONF_T_P_MODE_ADDR
+        buf[2] = ctrl_meas
+        ok = self._set_regs(constants.CONF_ODR_RUN_GAS_NBC_ADDR, buf)
+
+        # Keeps get_profile_duration() in step with the selected profile
+        self.gas_settings.nb_conv = nb_conv
+        self.gas_settings.heatr_temp, self.gas_settings.heatr_dur = sequence[nb_conv]
+        return ok
 
+    def get_profile_duration(self):
+        """Get the duration of one forced-mode measurement in milliseconds.
 
-            self.data.status = regs[0] & constants.NEW_DATA_MSK
-            self.data.gas_index = regs[0] & constants.GAS_INDEX_MSK
-            self.data.meas_index = regs[1]
+        Computed from the oversampling settings in .tph_settings and, when
+        gas measurement is enabled, the heater duration in .gas_settings.
+        Callers can use it to schedule collect() after trigger().
 
+        """
+        tph_dur = self._get_tph_duration_us() + constants.WAKE_UP_DUR
+        duration = (tph_dur + 500) // 1000
+
+        if self.gas_settings.run_gas:
+            duration += self.gas_settings.heatr_dur or 0
+
+        return duration
+
+    def _get_tph_duration_us(self):
+        """Get the TPH conversion time in microseconds, without the forced-mode wake-up."""
+        cycles = constants.OS_TO_MEAS_CYCLES
+        meas_cycles = cycles[self.tph_settings.os_temp]
+        meas_cycles += cycles[self.tph_settings.os_pres]
+        meas_cycles += cycles[self.tph_settings.os_hum]
+
+        tph_dur = meas_cycles * constants.MEAS_CYCLE_DUR
+        tph_dur += constants.TPH_SWITCH_DUR
+        tph_dur += constants.GAS_MEAS_DUR
+        return tph_dur
+
+    def ready(self):
+        """Return True once the conversion started by trigger() has completed."""
+        if not self._pending:
+            return False
+        status = self._read_byte(constants.FIELD0_ADDR)
+        if status is None:
+            return False
+        return (status & constants.NEW_DATA_MSK) != 0
+
+    def collect(self):
+        """Read the result of the conversion started by trigger().
+
+        Never waits. Stores data in .data and returns True upon success,
+        False if no conversion is pending or it has not completed yet.
+        The outcome is counted in .stats once per conversion: polls before
+        the deadline that find no new data or hit a bus error are not
+        counted. Once the deadline has passed, the status of the last poll,
+        W_NO_NEW_DATA or E_COM_FAIL, is counted and the conversion dropped.
+
+        """
+        if not self._pending:
+            return False
+        if not self.alloc_trace:
+            return self._record_collect(self._collect())
+        before = self._alloc_trace_begin()
+        result = self._record_collect(self._collect())
+        self._alloc_trace_end(before)
+        return result
+
+    def _record_collect(self, status):
+        """Count the outcome of a collect() poll in .stats. Returns True on OK."""
+        if status != constants.OK:
+            if time.ticks_diff(self._deadline, time.ticks_ms()) > 0:
+                # Still converting, or a bus error the next poll may recover from
+                return False
+            self._pending = False
+        return self.stats.record(status) == constants.OK
+
+    def _collect(self):
+        """Read a pending conversion. Returns OK, W_NO_NEW_DATA or E_COM_FAIL."""
+        if not self._pending:
+            return constants.W_NO_NEW_DATA
+
+        # Decoded in place from the preallocated field buffer
+        regs = self._field_buf
+        if not self._read_into(constants.FIELD0_ADDR, regs, constants.FIELD_LENGTH):
+            return constants.E_COM_FAIL
+
+        if (regs[0] & constants.NEW_DATA_MSK) == 0:
+            return constants.W_NO_NEW_DATA
+
+        self._pending = False
+        self._store(regs)
+        return constants.OK
+
+    def _store(self, regs):
+        """Publish a raw field block, or buffer it in raw capture mode.
+
+        Returns the published record, None when the frame was buffered.
+
+        """
+        if self._raw_frames is not None:
+            # Compensation is deferred until .data is read or drain_raw() runs
+            self._raw_frames.push(regs)
+            self._raw_dirty = True
+            return None
+        return self._publish(regs)
+
+    def _publish(self, regs):
+        """Decode a raw field block into the next pooled record and make it .data."""
+        record = self._pool.next()
+        self._decode_field(regs, record)
+        self._data = record
+        return record
+
+    def _decode_field(self, regs, data):
+        """Compensate a raw field block into a FieldData instance."""
+        data.status = regs[0] & constants.NEW_DATA_MSK
+        data.gas_index = regs[0] & constants.GAS_INDEX_MSK
+        data.meas_index = regs[1]
+
+        adc_temp = (regs[5] << 12) | (regs[6] << 4) | (regs[7] >> 4)
+        temperature = self._calc_temperature(adc_temp)
+        data.temperature = temperature / 100.0
+        self.ambient_temperature = temperature
+
+        # Channels that were not converted are skipped, see configure()
+        if self.tph_settings.os_pres:
             adc_pres = (regs[2] << 12) | (regs[3] << 4) | (regs[4] >> 4)
-            adc_temp = (regs[5] << 12) | (regs[6] << 4) | (regs[7] >> 4)
+            data.pressure = self._calc_pressure(adc_pres) / 100.0
+        else:
+            data.pressure = None
+
+        if self.tph_settings.os_hum:
             adc_hum = (regs[8] << 8) | regs[9]
-            adc_gas_res_low = (regs[13] << 2) | (regs[14] >> 6)
+            data.humidity = self._calc_humidity(adc_hum) / 1000.0
+        else:
+            data.humidity = None
+
+        if not self.gas_settings.run_gas:
+            data.heat_stable = False
+            data.gas_resistance = None
+        elif self._variant == constants.VARIANT_HIGH:
+            data.status |= regs[16] & (constants.GASM_VALID_MSK | constants.HEAT_STAB_MSK)
+            data.heat_stable = (data.status & constants.HEAT_STAB_MSK) > 0
             adc_gas_res_high = (regs[15] << 2) | (regs[16] >> 6)
-            gas_range_l = regs[14] & constants.GAS_RANGE_MSK
             gas_range_h = regs[16] & constants.GAS_RANGE_MSK
+            data.gas_resistance = self._calc_gas_resistance_high(adc_gas_res_high, gas_range_h)
+        else:
+            data.status |= regs[14] & (constants.GASM_VALID_MSK | constants.HEAT_STAB_MSK)
+            data.heat_stable = (data.status & constants.HEAT_STAB_MSK) > 0
+            adc_gas_res_low = (regs[13] << 2) | (regs[14] >> 6)
+            gas_range_l = regs[14] & constants.GAS_RANGE_MSK
+            data.gas_resistance = self._calc_gas_resistance_low(adc_gas_res_low, gas_range_l)
 
+    def get_sensor_data(self):
+        """Get sensor data. Stores data in .data and returns True upon success.
 
-            if self._variant == constants.VARIANT_HIGH:
-                self.data.status |= regs[16] & constants.GASM_VALID_MSK
-                self.data.status |= regs[16] & constants.HEAT_STAB_MSK
-            else:
-                self.data.status |= regs[14] & constants.GASM_VALID_MSK
-                self.data.status |= regs[14] & constants.HEAT_STAB_MSK
+        Blocking wrapper around trigger() and collect(). Avoid calling it
+        from a timer callback; use the two-phase API there instead.
+        .stats.last_status tells why a read failed, see measure().
 
-            self.data.heat_stable = (self.data.status & constants.HEAT_STAB_MSK) > 0
+        """
+        return self.measure() == constants.OK
 
-            temperature = self._calc_temperature(adc_temp)
-            self.data.temperature = temperature / 100.0
-            self.ambient_temperature = temperature
+    def measure(self):
+        """Trigger a measurement and wait for it, storing the data in .data.
 
+        Waits the expected conversion time, then polls with a short backoff
+        until the conversion completes or its deadline passes.
 
-            self.data.pressure = self._calc_pressure(adc_pres) / 100.0
+        :return: OK, W_NO_NEW_DATA if the conversion did not complete in time,
+            or E_COM_FAIL on an I2C error. Also counted in .stats.
 
-            self.data.humidity = self._calc_humidity(adc_hum) / 1000.0
+        """
+        if not self.alloc_trace:
+            return self.stats.record(self._measure())
+        before = self._alloc_trace_begin()
+        result = self.stats.record(self._measure())
+        self._alloc_trace_end(before)
+        return result
+
+    def _measure(self):
+        if not self._trigger():
+            return constants.E_COM_FAIL
+
+        deadline = self._deadline
+        time.sleep_ms(self.get_profile_duration())
+
+        backoff = constants.POLL_BACKOFF_MIN_MS
+        while True:
+            status = self._collect()
+            if status == constants.OK:
+                return status
+            remaining = time.ticks_diff(deadline, time.ticks_ms())
+            if remaining <= 0:
+                self._pending = False
+                return status
+            time.sleep_ms(min(backoff, remaining))
+            if backoff < constants.POLL_PERIOD_MS:
+                backoff = min(backoff << 1, constants.POLL_PERIOD_MS)
+
+    def supports_parallel_mode(self):
+        """Return True if the sensor is a BME688, the variant with parallel mode."""
+        return self._variant == constants.VARIANT_HIGH
+
+    def start_parallel(self, heater_profiles, shared_duration):
+        """Run heater profiles continuously in parallel mode (BME688 only).
+
+        The sensor steps through the profiles on its own, converting
+        temperature, pressure and humidity alongside each gas measurement,
+        and keeps the latest three results in its field blocks. Read them
+        with collect_parallel(). Oversampling, filter and channels are the
+        ones applied by configure(); call configure() again after
+        stop_parallel() to go back to forced mode.
+
+        The profiles, shared duration, gas control and mode are written in a
+        single I2C transaction.
+
+        :param heater_profiles: Up to 10 (temperature, multiplier) tuples: heater
+            target in degrees celsius and step length in units of shared_duration
+        :param shared_duration: Step unit in milliseconds, TPH conversion included
+        :return: True upon success
 
-            if self._variant == constants.VARIANT_HIGH:
-                self.data.gas_resistance = self._calc_gas_resistance_high(adc_gas_res_high, gas_range_h)
-            else:
-                self.data.gas_resistance = self._calc_gas_resistance_low(adc_gas_res_low, gas_range_l)
+        """
+        if not self.supports_parallel_mode():
+            raise ValueError('Parallel mode needs a BME688.')
+        if not 0 < len(heater_profiles) <= constants.NBCONV_MAX + 1:
+            raise ValueError('Between 1 and {} heater profiles are supported.'.format(constants.NBCONV_MAX + 1))
+        tph_dur = (self._get_tph_duration_us() + 999) // 1000
+        if shared_duration <= tph_dur:
+            raise ValueError('Shared duration must exceed the {} ms TPH conversion.'.format(tph_dur))
+
+        regs = []
+        for nb_profile, (heatr_temp, multiplier) in enumerate(heater_profiles):
+            regs.append((constants.RES_HEAT0_ADDR + nb_profile,
+                         int(self._calc_heater_resistance(heatr_temp))))
+            regs.append((constants.GAS_WAIT0_ADDR + nb_profile, multiplier & 0xff))
+        regs.append((constants.GAS_WAIT_SHARED_ADDR,
+                     self._calc_heater_duration_shared(shared_duration - tph_dur)))
+
+        heater = (constants.ENABLE_HEATER & constants.HCTRL_MSK) >> constants.HCTRL_POS
+        run_gas = constants.ENABLE_GAS_MEAS_HIGH
+        regs.append((constants.CONF_HEAT_CTRL_ADDR,
+                     self._update_shadow(constants.CONF_HEAT_CTRL_ADDR, constants.HCTRL_MSK,
+                                         constants.HCTRL_POS, heater)))
+        self._update_shadow(constants.CONF_ODR_RUN_GAS_NBC_ADDR, constants.RUN_GAS_MSK, constants.RUN_GAS_POS, run_gas)
+        # In parallel mode nb_conv holds the number of profiles to cycle through
+        regs.append((constants.CONF_ODR_RUN_GAS_NBC_ADDR,
+                     self._update_shadow(constants.CONF_ODR_RUN_GAS_NBC_ADDR, constants.NBCONV_MSK,
+                                         constants.NBCONV_POS, len(heater_profiles))))
+        regs.append((constants.CONF_T_P_MODE_ADDR,
+                     self._shadow[constants.REG_TEMP_INDEX] | constants.PARALLEL_MODE))
+
+        if self._parallel_buf is None:
+            self._parallel_buf = bytearray(constants.FIELD_ADDR_OFFSET * constants.FIELD_COUNT_PARALLEL)
+            view = memoryview(self._parallel_buf)
+            # One view per field block, created once so reads do not allocate
+            self._parallel_fields = [view[i * constants.FIELD_ADDR_OFFSET:i * constants.FIELD_ADDR_OFFSET + constants.FIELD_LENGTH]
+                                     for i in range(constants.FIELD_COUNT_PARALLEL)]
+            self._parallel_stale = [-1] * constants.FIELD_COUNT_PARALLEL
+            self._parallel_order = [0] * constants.FIELD_COUNT_PARALLEL
+            self._parallel_ages = [0] * constants.FIELD_COUNT_PARALLEL
+            self.parallel_data = [None] * constants.FIELD_COUNT_PARALLEL
+            # .data keeps the last forced-mode record, which the new pool never reuses
+            self._pool = FieldDataPool(constants.PARALLEL_DATA_POOL_SIZE)
+
+        # Blocks left over from earlier conversions still flag new data;
+        # they are skipped until overwritten
+        stale = self._parallel_stale
+        ok = self._read_into(constants.FIELD0_ADDR, self._parallel_buf, len(self._parallel_buf))
+        for i, block in enumerate(self._parallel_fields):
+            stale[i] = block[1] if ok and block[0] & constants.NEW_DATA_MSK else -1
+        self._parallel_newest = None
+        # A poll counts as W_NO_NEW_DATA only once no block has arrived for a
+        # whole profile cycle, with the allowance measure() gives a conversion
+        cycle = shared_duration * sum(multiplier for _, multiplier in heater_profiles)
+        self._parallel_timeout = cycle + (cycle >> 2) + constants.READY_TIMEOUT_MARGIN_MS
+        self._deadline = time.ticks_add(time.ticks_ms(), self._parallel_timeout)
+
+        self._heater_sequence = None
+        self._pending = False
+        self.gas_settings.heatr_ctrl = heater
+        self.gas_settings.run_gas = run_gas
+        self.power_mode = constants.PARALLEL_MODE
+        return self._set_regs_burst(regs)
+
+    def stop_parallel(self):
+        """Put the sensor back to sleep after start_parallel()."""
+        self.set_power_mode(constants.SLEEP_MODE)
 
+    def collect_parallel(self):
+        """Read the results completed since the previous call in parallel mode.
 
-            return True
+        Never waits. All three field blocks come in one burst read and only
+        the new ones are decoded, oldest first, into .parallel_data; .data is
+        the newest. Call it at least once every three heater steps so no
+        result is overwritten before it is read.
 
-        return False
+        In raw capture mode the new field blocks are buffered instead, see
+        set_raw_capture(), and .parallel_data is left as it is.
+
+        :return: Number of new records at the start of .parallel_data, 0 if
+            nothing completed or the read failed. Counted in .stats, except
+            for polls that find nothing new within a profile cycle of the
+            previous result.
+
+        """
+        if not self.alloc_trace:
+            return self._collect_parallel()
+        before = self._alloc_trace_begin()
+        count = self._collect_parallel()
+        self._alloc_trace_end(before)
+        return count
+
+    def _collect_parallel(self):
+        if self._parallel_buf is None:
+            return 0
+        fields = self._parallel_fields
+        if not self._read_into(constants.FIELD0_ADDR, self._parallel_buf, len(self._parallel_buf)):
+            self.stats.record(constants.E_COM_FAIL)
+            return 0
+
+        # Order the new blocks by meas_index, counted from the newest one
+        # already published; blocks at or before it were read by an earlier call
+        newest = self._parallel_newest
+        stale = self._parallel_stale
+        order = self._parallel_order
+        ages = self._parallel_ages
+        count = 0
+        for i in range(constants.FIELD_COUNT_PARALLEL):
+            regs = fields[i]
+            if (regs[0] & constants.NEW_DATA_MSK) == 0:
+                continue
+            if stale[i] >= 0:
+                if regs[1] == stale[i]:
+                    continue
+                stale[i] = -1
+            if newest is None:
+                # The live blocks are a few indexes apart, so an anchor well
+                # behind any one of them orders them all across the wrap at 255
+                newest = (regs[1] - 0x40) & 0xff
+            age = (regs[1] - newest) & 0xff
+            if not 0 < age < 0x80:
+                continue
+            j = count
+            while j > 0 and ages[j - 1] > age:
+                ages[j] = ages[j - 1]
+                order[j] = order[j - 1]
+                j -= 1
+            ages[j] = age
+            order[j] = i
+            count += 1
+
+        records = self.parallel_data
+        for k in range(count):
+            regs = fields[order[k]]
+            record = self._store(regs)
+            if record is not None:
+                records[k] = record
+            self._parallel_newest = regs[1]
+
+        if count:
+            self._deadline = time.ticks_add(time.ticks_ms(), self._parallel_timeout)
+            self.stats.record(constants.OK)
+        elif time.ticks_diff(self._deadline, time.ticks_ms()) <= 0:
+            # Nothing for a whole profile cycle; counted once per cycle
+            self._deadline = time.ticks_add(time.ticks_ms(), self._parallel_timeout)
+            self.stats.record(constants.W_NO_NEW_DATA)
+        return count
+
+    @property
+    def data(self):
+        """Latest sensor data, compensated on first access in raw capture mode.
+
+        Each measurement gets its own FieldData record, so keep a reference
+        to read several fields of one measurement: data = bme.data.
+
+        """
+        if self._raw_dirty:
+            self._raw_dirty = False
+            self._publish(self._raw_frames.latest())
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    def set_raw_capture(self, depth):
+        """Store raw field blocks instead of compensating them in collect().
 
+        Frames go to a ring buffer of depth entries. Compensation then runs
+        lazily when .data is read, or in bulk with drain_raw(), and
+        raw_frames() returns the buffered frames for off-device decoding.
+
+        :param depth: Number of frames to buffer, 0 turns raw capture off
+
+        """
+        if self._raw_dirty:
+            # Keeps the newest captured frame in .data
+            self._publish(self._raw_frames.latest())
+        self._raw_frames = RawFrameBuffer(depth) if depth else None
+        self._raw_dirty = False
+
+    def raw_frames(self):
+        """Get the buffered raw frames oldest first, FIELD_LENGTH bytes each."""
+        if self._raw_frames is None:
+            return b''
+        return self._raw_frames.to_bytes()
+
+    def drain_raw(self, callback=None):
+        """Compensate all buffered raw frames, oldest first, and empty the buffer.
+
+        Meant for idle periods. Leaves the newest frame in .data.
+
+        :param callback: Optional function called with .data after each frame.
+            Records are reused after FIELD_DATA_POOL_SIZE - 1 further frames,
+            copy the values out to keep them longer.
+        :return: Number of frames compensated
+
+        """
+        frames = self._raw_frames
+        if frames is None:
+            return 0
+        count = frames.count
+        for i in range(count):
+            record = self._publish(frames.get(i))
+            if callback is not None:
+                callback(record)
+        frames.clear()
+        self._raw_dirty = False
+        return count
 
     def _set_bits(self, register, mask, position, value):
-        """Mask out and set one or more bits in a register."""
-        temp = self._get_regs(register, 1)[0]
+        """Mask out and set one or more bits in a register.
+
+        Registers covered by the shadow copy are updated there and written
+        without reading them back from the device first.
+
+        """
+        index = register - constants.CONF_HEAT_CTRL_ADDR
+        if 0 <= index < constants.REG_BUFFER_LENGTH:
+            temp = self._update_shadow(register, mask, position, value)
+        else:
+            temp = self._get_regs(register, 1)[0]
+            temp &= ~mask
+            temp |= (value << position) & mask
+        self._set_regs(register, temp)
+
+    def _update_shadow(self, register, mask, position, value):
+        """Mask out and set one or more bits in the shadow copy only, returning the new value."""
+        index = register - constants.CONF_HEAT_CTRL_ADDR
+        temp = self._shadow[index]
         temp &= ~mask
         temp |= (value << position) & mask
-        self._set_regs(register, temp)
+        self._shadow[index] = temp
+        return temp
 
+    def _get_bits(self, register, mask, position):
+        """Get one or more bits of a configuration register from the shadow copy."""
+        return (self._shadow[register - constants.CONF_HEAT_CTRL_ADDR] & mask) >> position
 
-    def _get_regs(self, register, length):
-        r_data = bytearray(length)
+
+    def _alloc_trace_begin(self):
+        self._gc_was_enabled = gc.isenabled()
+        gc.disable()
+        return gc.mem_alloc()
+
+    def _alloc_trace_end(self, before):
+        self.last_alloc = gc.mem_alloc() - before
+        if self._gc_was_enabled:
+            gc.enable()
+
+    def _read_into(self, register, buf, length):
+        """Read length bytes starting at register into buf without allocating.
+
+        Returns True upon success.
+
+        """
+        self._addr_buf[0] = register
         try:
-            self._i2c.read(self.i2c_addr,
-                   bytearray([register]),  # 1-byte register address
+            ret = self._i2c.read(self.i2c_addr,
+                   self._addr_buf,         # 1-byte register address
                    1,                      # regaddr_len
-                   r_data,
+                   buf,
                    length,
                    0)                      # stop bit
-            return list(r_data)
+            # QuecPython reports bus errors by returning -1 rather than raising
+            return ret != -1
         except Exception as e:
-            return []
+            return False
+
+    def _read_byte(self, register):
+        """Read a single register without allocating. Returns None on failure."""
+        if self._read_into(register, self._byte_buf, 1):
+            return self._byte_buf[0]
+        return None
+
+    def _get_regs(self, register, length):
+        r_data = bytearray(length)
+        if self._read_into(register, r_data, length):
+            return list(r_data)
+        return []
 
     def _set_regs(self, register, value):
+        """Write value, an int or a sequence of bytes, from register on. Returns True upon success."""
         try:
             if isinstance(value, int):
-                data = bytearray([value])
+                # Single register writes reuse the preallocated buffer
+                data = self._byte_buf
+                data[0] = value
+                length = 1
+            elif isinstance(value, bytearray):
+                data = value
+                length = len(data)
             else:
                 data = bytearray(value)
+                length = len(data)
 
-            self._i2c.write(
+            self._addr_buf[0] = register
+            ret = self._i2c.write(
                 self.i2c_addr,
-                bytearray([register]),  # 1-byte register address
+                self._addr_buf,         # 1-byte register address
                 1,                      # regaddr_len
                 data,
-                len(data)               # datasize
+                length                  # datasize
             )
+            return ret != -1
         except Exception as e:
-            pass
+            return False
+
+    def _set_regs_burst(self, regs):
+        """Write several (register, value) pairs in a single I2C transaction.
+
+        After the first register address the BME680 takes alternating
+        register address and data bytes.
+
+        """
+        data = [regs[0][1]]
+        for register, value in regs[1:]:
+            data.append(register)
+            data.append(value)
+        return self._set_regs(regs[0][0], data)
 
     def _calc_temperature(self, temperature_adc):
         """Convert the raw temperature to degrees C using calibration_data."""
@@ -520,6 +1215,9 @@ class BME680(BME680Data):
         Applies to Variant ID == 0x00 only.
 
         """
+        tables = _get_gas_lookup_tables()
+        lookupTable1 = tables[0]
+        lookupTable2 = tables[1]
         var1 = ((1340 + (5 * self.calibration_data.range_sw_err)) * (lookupTable1[gas_range])) >> 16
         var2 = (((gas_res_adc << 15) - (16777216)) + var1)
         var3 = ((lookupTable2[gas_range] * var1) >> 9)
@@ -530,6 +1228,106 @@ class BME680(BME680Data):
 
         return calc_gas_res
 
+    # Small-int compensation. These return exactly what the routines above
+    # return, but keep every intermediate below 2**30 for readings within the
+    # sensor's operating range, so MicroPython never promotes them to bignums.
+    # A wide product (a * b) >> n is computed as
+    # ((a * (b >> 8)) + ((a * (b & 0xff)) >> 8)) >> (n - 8), which is exact.
+
+    def _calc_temperature_small(self, temperature_adc):
+        """Convert the raw temperature to degrees C, see _calc_temperature()."""
+        cal = self.calibration_data
+        var1 = (temperature_adc >> 3) - (cal.par_t1 << 1)
+        var2 = ((var1 * (cal.par_t2 >> 8)) + ((var1 * (cal.par_t2 & 0xff)) >> 8)) >> 3
+        half = var1 >> 1
+        var3 = ((half * (half >> 8)) + ((half * (half & 0xff)) >> 8)) >> 4
+        # (var3 * (par_t3 << 4)) >> 14
+        var3 = (var3 * cal.par_t3) >> 10
+
+        cal.t_fine = (var2 + var3) + self.offset_temp_in_t_fine
+        return ((cal.t_fine * 5) + 128) >> 8
+
+    def _calc_pressure_small(self, pressure_adc):
+        """Convert the raw pressure, see _calc_pressure()."""
+        cal = self.calibration_data
+        var1 = (cal.t_fine >> 1) - 64000
+        quarter = var1 >> 2
+        # (quarter * quarter) >> 8
+        square = (quarter * (quarter >> 8)) + ((quarter * (quarter & 0xff)) >> 8)
+        var2 = ((square >> 3) * cal.par_p6) >> 2
+        var2 = var2 + ((var1 * cal.par_p5) << 1)
+        # ((var2 >> 2) + (par_p4 << 16)) >> 12
+        var2 = (var2 >> 14) + (cal.par_p4 << 4)
+
+        # ((square >> 5) * (par_p3 << 5)) >> 3 plus (par_p2 * var1) >> 1, all >> 18
+        low = (((square >> 5) * cal.par_p3) << 2) + ((var1 * (cal.par_p2 & 0xff)) >> 1)
+        var1 = ((low >> 7) + (var1 * (cal.par_p2 >> 8))) >> 11
+
+        var1 += 32768
+        var1 = ((var1 * (cal.par_p1 >> 8)) + ((var1 * (cal.par_p1 & 0xff)) >> 8)) >> 7
+        calc_pressure = 1048576 - pressure_adc - var2
+
+        # calc_pressure * 3125 divided by var1, without forming the product
+        quotient = calc_pressure // var1
+        remainder = calc_pressure - quotient * var1
+        if calc_pressure >= 687195:  # calc_pressure * 3125 >= 1 << 31
+            calc_pressure = (quotient * 3125 + (remainder * 3125) // var1) << 1
+        else:
+            calc_pressure = quotient * 6250 + (remainder * 6250) // var1
+
+        var1 = (cal.par_p9 * (((calc_pressure >> 3) * (calc_pressure >> 3)) >> 13)) >> 12
+        var2 = ((calc_pressure >> 2) * cal.par_p8) >> 13
+        cube = calc_pressure >> 8
+        cube = cube * cube * cube
+        var3 = (((cube >> 8) * cal.par_p10) + (((cube & 0xff) * cal.par_p10) >> 8)) >> 9
+
+        return calc_pressure + ((var1 + var2 + var3 + (cal.par_p7 << 7)) >> 4)
+
+    def _calc_humidity_small(self, humidity_adc):
+        """Convert the raw humidity, see _calc_humidity()."""
+        cal = self.calibration_data
+        temp_scaled = ((cal.t_fine * 5) + 128) >> 8
+        var1 = (humidity_adc - (cal.par_h1 * 16)) - \
+               (((temp_scaled * cal.par_h3) // 100) >> 1)
+        var2 = (cal.par_h2 *
+                (((temp_scaled * cal.par_h4) // 100) +
+                 (((temp_scaled * ((temp_scaled * cal.par_h5) // 100)) >> 6) // 100) +
+                 (1 * 16384))) >> 10
+        var3 = var1 * var2
+        var4 = cal.par_h6 << 7
+        var4 = ((var4) + ((temp_scaled * cal.par_h7) // 100)) >> 4
+        var5 = ((var3 >> 14) * (var3 >> 14)) >> 10
+        var6 = ((var4 * (var5 >> 8)) << 7) + ((var4 * (var5 & 0xff)) >> 1)
+        calc_hum = (((var3 + var6) >> 10) * 1000) >> 12
+
+        return min(max(calc_hum, 0), 100000)
+
+    def _calc_gas_resistance_high_small(self, gas_res_adc, gas_range):
+        """Convert the raw gas resistance, see _calc_gas_resistance_high()."""
+        var1 = 262144 >> gas_range
+        var2 = ((gas_res_adc - 512) * 3) + 4096
+
+        # Exact as a float, so the division rounds like the integer one
+        return ((var1 * 10000.0) / var2) * 100
+
+    def _calc_gas_resistance_low_small(self, gas_res_adc, gas_range):
+        """Convert the raw gas resistance, see _calc_gas_resistance_low()."""
+        tables = _get_gas_lookup_tables()
+        scale = 1340 + (5 * self.calibration_data.range_sw_err)
+        var1 = (scale * tables[2][gas_range]) + ((scale * tables[3][gas_range]) >> 16)
+        var2 = (((gas_res_adc << 15) - (16777216)) + var1)
+
+        # (lookupTable2 * var1) >> 9 stays below 2**53, so it is built exactly
+        # from floats instead of bignums before the division.
+        var3 = (float(tables[4][gas_range]) * var1 * 128.0) + \
+               ((float(tables[5][gas_range]) * var1) // 512.0)
+        calc_gas_res = (var3 + (var2 >> 1)) / var2
+
+        if calc_gas_res < 0:
+            calc_gas_res = 4294967296.0 + calc_gas_res
+
+        return calc_gas_res
+
     def _calc_heater_resistance(self, temperature):
    # """Convert raw heater resistance using calibration data."""
 
@@ -564,11 +1362,117 @@ class BME680(BME680Data):
             return int(duration + (factor * 64))
 
         return 0xff
+
+    def _calc_heater_duration_shared(self, duration):
+        """Calculate the gas_wait_shared value for a duration in milliseconds, counted in 0.477 ms steps."""
+        if duration < 0x783:
+            factor = 0
+            duration = duration * 1000 // 477
+
+            while duration > 0x3f:
+                duration >>= 2
+                factor += 1
+
+            return int(duration + (factor * 64))
+
+        return 0xff
     def initialize_bme(self):
+        """Reset and reapply the default configuration with gas measurement disabled.
+
+        The constructor already resets and configures the sensor; pass a
+        SensorConfig to it instead of calling this afterwards.
+
+        """
         self.soft_reset()
-        time.sleep_ms(50)
-        self.set_humidity_oversample(2)
-        self.set_pressure_oversample(3)
-        self.set_temperature_oversample(4)
-        self.set_filter(2)
-        return 
+        self.configure(SensorConfig(run_gas=constants.DISABLE_GAS_MEAS)) 
+
+
+class BME680Group:
+    """Several BME680 sensors read together, e.g. on the primary and secondary address of one bus.
+
+    All sensors are put into forced mode back to back and the group waits
+    once, for the longest conversion, before reading each result. Sampling
+    N sensors then takes about as long as sampling the slowest one.
+
+    :param sensors: BME680 instances
+
+    """
+
+    def __init__(self, sensors):  # noqa D107
+        self.sensors = tuple(sensors)
+        # Per sensor, True if its latest read succeeded
+        self.results = [False] * len(self.sensors)
+
+    def trigger(self):
+        """Start a forced-mode conversion on every sensor.
+
+        Returns True if every sensor was triggered. A sensor whose trigger
+        write failed is not pending and counts as done in collect().
+
+        """
+        results = self.results
+        ok = True
+        for i, sensor in enumerate(self.sensors):
+            results[i] = False
+            ok = sensor.trigger() and ok
+        return ok
+
+    def get_profile_duration(self):
+        """Get the duration of the longest sensor measurement in milliseconds."""
+        return max(sensor.get_profile_duration() for sensor in self.sensors)
+
+    def collect(self):
+        """Read the results of every pending conversion without waiting.
+
+        Updates .results and returns True once no sensor is converting any
+        more. .results then tells which sensors have new data; the others
+        failed to trigger, had a bus error or timed out.
+
+        """
+        results = self.results
+        complete = True
+        for i, sensor in enumerate(self.sensors):
+            if sensor._pending:
+                results[i] = sensor.collect()
+                complete = complete and not sensor._pending
+        return complete
+
+    def get_sensor_data(self):
+        """Get data from every sensor into its .data.
+
+        Returns True if all sensors were read; .results tells which ones were
+        and each sensor's .stats records its outcome, as with measure().
+
+        """
+        sensors = self.sensors
+        results = self.results
+        statuses = [constants.E_COM_FAIL] * len(sensors)
+        for i, sensor in enumerate(sensors):
+            results[i] = False
+            # A sensor whose trigger write fails is not pending and stays E_COM_FAIL
+            sensor._trigger()
+
+        duration = self.get_profile_duration()
+        timeout = duration + (duration >> 2) + constants.READY_TIMEOUT_MARGIN_MS
+        deadline = time.ticks_add(time.ticks_ms(), timeout)
+        time.sleep_ms(duration)
+
+        backoff = constants.POLL_BACKOFF_MIN_MS
+        while True:
+            complete = True
+            for i, sensor in enumerate(sensors):
+                if sensor._pending:
+                    statuses[i] = sensor._collect()
+                    results[i] = statuses[i] == constants.OK
+                    complete = complete and results[i]
+            remaining = time.ticks_diff(deadline, time.ticks_ms())
+            if complete or remaining <= 0:
+                break
+            time.sleep_ms(min(backoff, remaining))
+            if backoff < constants.POLL_PERIOD_MS:
+                backoff = min(backoff << 1, constants.POLL_PERIOD_MS)
+
+        for i, sensor in enumerate(sensors):
+            sensor._pending = False
+            sensor.stats.record(statuses[i])
+        return all(results)
@@ -1,240 +1,309 @@
 """BME680 constants, structures and utilities."""
+import ustruct as struct
+from micropython import const
 
 # BME680 General config
-POLL_PERIOD_MS = 10
+POLL_PERIOD_MS = const(10)
+# First wait between data-ready polls, doubled up to POLL_PERIOD_MS
+POLL_BACKOFF_MIN_MS = const(2)
+# Slack on top of the expected conversion time, plus a quarter of it,
+# before a measurement counts as timed out
+READY_TIMEOUT_MARGIN_MS = const(20)
 
 # BME680 I2C addresses
-I2C_ADDR_PRIMARY = 0x76
-I2C_ADDR_SECONDARY = 0x77
+I2C_ADDR_PRIMARY = const(0x76)
+I2C_ADDR_SECONDARY = const(0x77)
 
 # BME680 unique chip identifier
-CHIP_ID = 0x61
+CHIP_ID = const(0x61)
 
 # BME680 coefficients related defines
-COEFF_SIZE = 41
-COEFF_ADDR1_LEN = 25
-COEFF_ADDR2_LEN = 16
+COEFF_SIZE = const(41)
+COEFF_ADDR1_LEN = const(25)
+COEFF_ADDR2_LEN = const(16)
 
 # BME680 field_x related defines
-FIELD_LENGTH = 17
-FIELD_ADDR_OFFSET = 17
+FIELD_LENGTH = const(17)
+FIELD_ADDR_OFFSET = const(17)
 
 # Soft reset command
-SOFT_RESET_CMD = 0xb6
+SOFT_RESET_CMD = const(0xb6)
 
 # Error code definitions
-OK = 0
+OK = const(0)
 # Errors
-E_NULL_PTR = -1
-E_COM_FAIL = -2
-E_DEV_NOT_FOUND = -3
-E_INVALID_LENGTH = -4
+E_NULL_PTR = const(-1)
+E_COM_FAIL = const(-2)
+E_DEV_NOT_FOUND = const(-3)
+E_INVALID_LENGTH = const(-4)
 
 # Warnings
-W_DEFINE_PWR_MODE = 1
-W_NO_NEW_DATA = 2
+W_DEFINE_PWR_MODE = const(1)
+W_NO_NEW_DATA = const(2)
 
 # Info's
-I_MIN_CORRECTION = 1
-I_MAX_CORRECTION = 2
+I_MIN_CORRECTION = const(1)
+I_MAX_CORRECTION = const(2)
 
 # Register map
 # Other coefficient's address
-ADDR_RES_HEAT_VAL_ADDR = 0x00
-ADDR_RES_HEAT_RANGE_ADDR = 0x02
-ADDR_RANGE_SW_ERR_ADDR = 0x04
-ADDR_SENS_CONF_START = 0x5A
-ADDR_GAS_CONF_START = 0x64
+ADDR_RES_HEAT_VAL_ADDR = const(0x00)
+ADDR_RES_HEAT_RANGE_ADDR = const(0x02)
+ADDR_RANGE_SW_ERR_ADDR = const(0x04)
+ADDR_SENS_CONF_START = const(0x5A)
+ADDR_GAS_CONF_START = const(0x64)
 
 # Field settings
-FIELD0_ADDR = 0x1d
+FIELD0_ADDR = const(0x1d)
+# BME688 parallel mode fills three field blocks, FIELD_ADDR_OFFSET apart
+FIELD_COUNT_PARALLEL = const(3)
 
 # Heater settings
-RES_HEAT0_ADDR = 0x5a
-GAS_WAIT0_ADDR = 0x64
+RES_HEAT0_ADDR = const(0x5a)
+GAS_WAIT0_ADDR = const(0x64)
+GAS_WAIT_SHARED_ADDR = const(0x6e)
 
 # Sensor configuration registers
-CONF_HEAT_CTRL_ADDR = 0x70
-CONF_ODR_RUN_GAS_NBC_ADDR = 0x71
-CONF_OS_H_ADDR = 0x72
-MEM_PAGE_ADDR = 0xf3
-CONF_T_P_MODE_ADDR = 0x74
-CONF_ODR_FILT_ADDR = 0x75
+CONF_HEAT_CTRL_ADDR = const(0x70)
+CONF_ODR_RUN_GAS_NBC_ADDR = const(0x71)
+CONF_OS_H_ADDR = const(0x72)
+MEM_PAGE_ADDR = const(0xf3)
+CONF_T_P_MODE_ADDR = const(0x74)
+CONF_ODR_FILT_ADDR = const(0x75)
 
 # Coefficient's address
-COEFF_ADDR1 = 0x89
-COEFF_ADDR2 = 0xe1
+COEFF_ADDR1 = const(0x89)
+COEFF_ADDR2 = const(0xe1)
 
 # Chip identifier
-CHIP_ID_ADDR = 0xd0
-CHIP_VARIANT_ADDR = 0xf0
+CHIP_ID_ADDR = const(0xd0)
+CHIP_VARIANT_ADDR = const(0xf0)
 
-VARIANT_LOW = 0x00
-VARIANT_HIGH = 0x01
+VARIANT_LOW = const(0x00)
+VARIANT_HIGH = const(0x01)
 
 # Soft reset register
-SOFT_RESET_ADDR = 0xe0
+SOFT_RESET_ADDR = const(0xe0)
 
 # Heater control settings
-ENABLE_HEATER = 0x00
-DISABLE_HEATER = 0x08
+ENABLE_HEATER = const(0x00)
+DISABLE_HEATER = const(0x08)
 
 # Gas measurement settings
-DISABLE_GAS_MEAS = 0x00
-ENABLE_GAS_MEAS = -1  # Now used as auto-select
-ENABLE_GAS_MEAS_LOW = 0x01
-ENABLE_GAS_MEAS_HIGH = 0x02
+DISABLE_GAS_MEAS = const(0x00)
+ENABLE_GAS_MEAS = const(-1)  # Now used as auto-select
+ENABLE_GAS_MEAS_LOW = const(0x01)
+ENABLE_GAS_MEAS_HIGH = const(0x02)
 
 # Over-sampling settings
-OS_NONE = 0
-OS_1X = 1
-OS_2X = 2
-OS_4X = 3
-OS_8X = 4
-OS_16X = 5
+OS_NONE = const(0)
+OS_1X = const(1)
+OS_2X = const(2)
+OS_4X = const(3)
+OS_8X = const(4)
+OS_16X = const(5)
 
 # IIR filter settings
-FILTER_SIZE_0 = 0
-FILTER_SIZE_1 = 1
-FILTER_SIZE_3 = 2
-FILTER_SIZE_7 = 3
-FILTER_SIZE_15 = 4
-FILTER_SIZE_31 = 5
-FILTER_SIZE_63 = 6
-FILTER_SIZE_127 = 7
+FILTER_SIZE_0 = const(0)
+FILTER_SIZE_1 = const(1)
+FILTER_SIZE_3 = const(2)
+FILTER_SIZE_7 = const(3)
+FILTER_SIZE_15 = const(4)
+FILTER_SIZE_31 = const(5)
+FILTER_SIZE_63 = const(6)
+FILTER_SIZE_127 = const(7)
 
 # Power mode settings
-SLEEP_MODE = 0
-FORCED_MODE = 1
+SLEEP_MODE = const(0)
+FORCED_MODE = const(1)
+# BME688 only: the heater profiles run back to back, each with a TPH conversion
+PARALLEL_MODE = const(2)
+
+# Measurement plan channels, combined with | in SensorConfig(channels=...).
+# Temperature is always converted, pressure and humidity compensation need it.
+CHANNEL_TEMPERATURE = const(0x01)
+CHANNEL_PRESSURE = const(0x02)
+CHANNEL_HUMIDITY = const(0x04)
+CHANNEL_GAS = const(0x08)
+CHANNELS_ALL = const(0x0f)
+
+# Compensation implementations
+# COMPENSATION_INT is the reference integer code. COMPENSATION_SMALL_INT gives
+# identical results while keeping intermediates within MicroPython's small-int
+# range, so compensating a sample does not allocate bignums.
+COMPENSATION_INT = const(0)
+COMPENSATION_SMALL_INT = const(1)
+
+# FieldData records per sensor, see FieldDataPool
+FIELD_DATA_POOL_SIZE = const(3)
+# In parallel mode one read can publish FIELD_COUNT_PARALLEL records, so they
+# stay valid until the read after next
+PARALLEL_DATA_POOL_SIZE = const(2 * FIELD_COUNT_PARALLEL)
 
 # Delay related macro declaration
-RESET_PERIOD = 10
+RESET_PERIOD = const(10)
+
+# Measurement duration related defines, in microseconds
+MEAS_CYCLE_DUR = const(1963)
+TPH_SWITCH_DUR = const(477 * 4)
+GAS_MEAS_DUR = const(477 * 5)
+WAKE_UP_DUR = const(1000)
+
+# Conversion cycles per oversampling setting, indexed by OS_NONE..OS_16X
+OS_TO_MEAS_CYCLES = (0, 1, 2, 4, 8, 16)
 
 # SPI memory page settings
-MEM_PAGE0 = 0x10
-MEM_PAGE1 = 0x00
+MEM_PAGE0 = const(0x10)
+MEM_PAGE1 = const(0x00)
 
 # Ambient humidity shift value for compensation
-HUM_REG_SHIFT_VAL = 4
+HUM_REG_SHIFT_VAL = const(4)
 
 # Run gas enable and disable settings
-RUN_GAS_DISABLE = 0
-RUN_GAS_ENABLE = 1
+RUN_GAS_DISABLE = const(0)
+RUN_GAS_ENABLE = const(1)
 
 # Gas heater enable and disable settings
-GAS_HEAT_ENABLE = 0
-GAS_HEAT_DISABLE = 1
+GAS_HEAT_ENABLE = const(0)
+GAS_HEAT_DISABLE = const(1)
 
 # Buffer length macro declaration
-TMP_BUFFER_LENGTH = 40
-REG_BUFFER_LENGTH = 6
-FIELD_DATA_LENGTH = 3
-GAS_REG_BUF_LENGTH = 20
-GAS_HEATER_PROF_LEN_MAX = 10
+TMP_BUFFER_LENGTH = const(40)
+REG_BUFFER_LENGTH = const(6)
+FIELD_DATA_LENGTH = const(3)
+GAS_REG_BUF_LENGTH = const(20)
+GAS_HEATER_PROF_LEN_MAX = const(10)
 
 # Settings selector
-OST_SEL = 1
-OSP_SEL = 2
-OSH_SEL = 4
-GAS_MEAS_SEL = 8
-FILTER_SEL = 16
-HCNTRL_SEL = 32
-RUN_GAS_SEL = 64
-NBCONV_SEL = 128
-GAS_SENSOR_SEL = GAS_MEAS_SEL | RUN_GAS_SEL | NBCONV_SEL
+OST_SEL = const(1)
+OSP_SEL = const(2)
+OSH_SEL = const(4)
+GAS_MEAS_SEL = const(8)
+FILTER_SEL = const(16)
+HCNTRL_SEL = const(32)
+RUN_GAS_SEL = const(64)
+NBCONV_SEL = const(128)
+GAS_SENSOR_SEL = const(GAS_MEAS_SEL | RUN_GAS_SEL | NBCONV_SEL)
 
 # Number of conversion settings
-NBCONV_MIN = 0
-NBCONV_MAX = 9  # Was 10, but there are only 10 settings: 0 1 2 ... 8 9
+NBCONV_MIN = const(0)
+NBCONV_MAX = const(9)  # Was 10, but there are only 10 settings: 0 1 2 ... 8 9
 
 # Mask definitions
-GAS_MEAS_MSK = 0x30
-NBCONV_MSK = 0X0F
-FILTER_MSK = 0X1C
-OST_MSK = 0XE0
-OSP_MSK = 0X1C
-OSH_MSK = 0X07
-HCTRL_MSK = 0x08
-RUN_GAS_MSK = 0x30
-MODE_MSK = 0x03
-RHRANGE_MSK = 0x30
-RSERROR_MSK = 0xf0
-NEW_DATA_MSK = 0x80
-GAS_INDEX_MSK = 0x0f
-GAS_RANGE_MSK = 0x0f
-GASM_VALID_MSK = 0x20
-HEAT_STAB_MSK = 0x10
-MEM_PAGE_MSK = 0x10
-SPI_RD_MSK = 0x80
-SPI_WR_MSK = 0x7f
-BIT_H1_DATA_MSK = 0x0F
+GAS_MEAS_MSK = const(0x30)
+NBCONV_MSK = const(0X0F)
+FILTER_MSK = const(0X1C)
+OST_MSK = const(0XE0)
+OSP_MSK = const(0X1C)
+OSH_MSK = const(0X07)
+HCTRL_MSK = const(0x08)
+RUN_GAS_MSK = const(0x30)
+MODE_MSK = const(0x03)
+RHRANGE_MSK = const(0x30)
+RSERROR_MSK = const(0xf0)
+NEW_DATA_MSK = const(0x80)
+GAS_INDEX_MSK = const(0x0f)
+GAS_RANGE_MSK = const(0x0f)
+GASM_VALID_MSK = const(0x20)
+HEAT_STAB_MSK = const(0x10)
+MEM_PAGE_MSK = const(0x10)
+SPI_RD_MSK = const(0x80)
+SPI_WR_MSK = const(0x7f)
+BIT_H1_DATA_MSK = const(0x0F)
 
 # Bit position definitions for sensor settings
-GAS_MEAS_POS = 4
-FILTER_POS = 2
-OST_POS = 5
-OSP_POS = 2
-OSH_POS = 0
-HCTRL_POS = 3
-RUN_GAS_POS = 4
-MODE_POS = 0
-NBCONV_POS = 0
+GAS_MEAS_POS = const(4)
+FILTER_POS = const(2)
+OST_POS = const(5)
+OSP_POS = const(2)
+OSH_POS = const(0)
+HCTRL_POS = const(3)
+RUN_GAS_POS = const(4)
+MODE_POS = const(0)
+NBCONV_POS = const(0)
 
 # Array Index to Field data mapping for Calibration Data
-T2_LSB_REG = 1
-T2_MSB_REG = 2
-T3_REG = 3
-P1_LSB_REG = 5
-P1_MSB_REG = 6
-P2_LSB_REG = 7
-P2_MSB_REG = 8
-P3_REG = 9
-P4_LSB_REG = 11
-P4_MSB_REG = 12
-P5_LSB_REG = 13
-P5_MSB_REG = 14
-P7_REG = 15
-P6_REG = 16
-P8_LSB_REG = 19
-P8_MSB_REG = 20
-P9_LSB_REG = 21
-P9_MSB_REG = 22
-P10_REG = 23
-H2_MSB_REG = 25
-H2_LSB_REG = 26
-H1_LSB_REG = 26
-H1_MSB_REG = 27
-H3_REG = 28
-H4_REG = 29
-H5_REG = 30
-H6_REG = 31
-H7_REG = 32
-T1_LSB_REG = 33
-T1_MSB_REG = 34
-GH2_LSB_REG = 35
-GH2_MSB_REG = 36
-GH1_REG = 37
-GH3_REG = 38
+T2_LSB_REG = const(1)
+T2_MSB_REG = const(2)
+T3_REG = const(3)
+P1_LSB_REG = const(5)
+P1_MSB_REG = const(6)
+P2_LSB_REG = const(7)
+P2_MSB_REG = const(8)
+P3_REG = const(9)
+P4_LSB_REG = const(11)
+P4_MSB_REG = const(12)
+P5_LSB_REG = const(13)
+P5_MSB_REG = const(14)
+P7_REG = const(15)
+P6_REG = const(16)
+P8_LSB_REG = const(19)
+P8_MSB_REG = const(20)
+P9_LSB_REG = const(21)
+P9_MSB_REG = const(22)
+P10_REG = const(23)
+H2_MSB_REG = const(25)
+H2_LSB_REG = const(26)
+H1_LSB_REG = const(26)
+H1_MSB_REG = const(27)
+H3_REG = const(28)
+H4_REG = const(29)
+H5_REG = const(30)
+H6_REG = const(31)
+H7_REG = const(32)
+T1_LSB_REG = const(33)
+T1_MSB_REG = const(34)
+GH2_LSB_REG = const(35)
+GH2_MSB_REG = const(36)
+GH1_REG = const(37)
+GH3_REG = const(38)
+
+# Calibration cache file, keyed by chip variant and I2C address
+CALIB_CACHE_PATH = '/usr/bme680_calib_{:02x}_{:02x}.bin'
+CALIB_CACHE_MAGIC = b'BMC1'
+# Decoded coefficients in CALIB_CACHE_FIELDS order
+CALIB_CACHE_FMT = '<HhbHhbhhbbhhBHHbbbBbbhbBbB'
+CALIB_CACHE_FIELDS = ('par_t1', 'par_t2', 'par_t3',
+                      'par_p1', 'par_p2', 'par_p3', 'par_p4', 'par_p5',
+                      'par_p6', 'par_p7', 'par_p8', 'par_p9', 'par_p10',
+                      'par_h1', 'par_h2', 'par_h3', 'par_h4', 'par_h5', 'par_h6', 'par_h7',
+                      'par_gh1', 'par_gh2', 'par_gh3',
+                      'res_heat_range', 'res_heat_val', 'range_sw_err')
+
+# Gas baseline file of AirQuality, so the estimate survives restarts
+BASELINE_PATH = '/usr/bme680_baseline.bin'
+BASELINE_MAGIC = b'BGB1'
+# Magic, baseline resistance in Ohms, samples seen (capped at the burn-in)
+BASELINE_FMT = '<4sfH'
 
 # BME680 register buffer index settings
-REG_FILTER_INDEX = 5
-REG_TEMP_INDEX = 4
-REG_PRES_INDEX = 4
-REG_HUM_INDEX = 2
-REG_NBCONV_INDEX = 1
-REG_RUN_GAS_INDEX = 1
-REG_HCTRL_INDEX = 0
-
-# Look up tables for the possible gas range values
-lookupTable1 = [2147483647, 2147483647, 2147483647, 2147483647,
-                2147483647, 2126008810, 2147483647, 2130303777, 2147483647,
-                2147483647, 2143188679, 2136746228, 2147483647, 2126008810,
-                2147483647, 2147483647]
-
-lookupTable2 = [4096000000, 2048000000, 1024000000, 512000000,
-                255744255, 127110228, 64000000, 32258064,
-                16016016, 8000000, 4000000, 2000000,
-                1000000, 500000, 250000, 125000]
+REG_FILTER_INDEX = const(5)
+REG_TEMP_INDEX = const(4)
+REG_PRES_INDEX = const(4)
+REG_HUM_INDEX = const(2)
+REG_NBCONV_INDEX = const(1)
+REG_RUN_GAS_INDEX = const(1)
+REG_HCTRL_INDEX = const(0)
+
+
+def gas_lookup_tables():
+    """Get the gas range look up tables (lookupTable1, lookupTable2).
+
+    Only gas measurement on the low variant needs them, so they are built
+    on demand instead of at import.
+
+    """
+    lookupTable1 = [2147483647, 2147483647, 2147483647, 2147483647,
+                    2147483647, 2126008810, 2147483647, 2130303777, 2147483647,
+                    2147483647, 2143188679, 2136746228, 2147483647, 2126008810,
+                    2147483647, 2147483647]
+
+    lookupTable2 = [4096000000, 2048000000, 1024000000, 512000000,
+                    255744255, 127110228, 64000000, 32258064,
+                    16016016, 8000000, 4000000, 2000000,
+                    1000000, 500000, 250000, 125000]
+
+    return lookupTable1, lookupTable2
 
 
 def bytes_to_word(msb, lsb, bits=16, signed=False):
@@ -257,7 +326,15 @@ def twos_comp(val, bits=16):
 
 
 class FieldData:
-    """Structure for storing BME680 sensor data."""
+    """Structure for storing BME680 sensor data.
+
+    Records handed out by BME680.data come from a FieldDataPool and are
+    never modified once published, treat them as read-only.
+
+    """
+
+    __slots__ = ('status', 'heat_stable', 'gas_index', 'meas_index',
+                 'temperature', 'pressure', 'humidity', 'gas_resistance')
 
     def __init__(self):  # noqa D107
         # Contains new_data, gasm_valid & heat_stab
@@ -277,9 +354,121 @@ class FieldData:
         self.gas_resistance = None
 
 
+class FieldDataPool:
+    """Small ring of preallocated FieldData records.
+
+    The driver decodes each measurement into the next free record and then
+    publishes it, so a record a reader holds stays unchanged until size - 1
+    newer measurements have completed, and no record is allocated per sample.
+
+    """
+
+    __slots__ = ('records', 'index')
+
+    def __init__(self, size=FIELD_DATA_POOL_SIZE):  # noqa D107
+        if size < 2:
+            raise ValueError('The pool needs at least 2 records.')
+        self.records = [FieldData() for _ in range(size)]
+        # Record handed out last
+        self.index = 0
+
+    def next(self):
+        """Get the record to decode the next measurement into."""
+        index = self.index + 1
+        if index == len(self.records):
+            index = 0
+        self.index = index
+        return self.records[index]
+
+
+class ReadStats:
+    """Per-sensor count of measurement outcomes, to monitor bus health."""
+
+    __slots__ = ('ok', 'no_new_data', 'com_fail', 'last_status')
+
+    def __init__(self):  # noqa D107
+        self.reset()
+
+    def reset(self):
+        """Zero all counters."""
+        # Measurements read successfully
+        self.ok = 0
+        # Conversions that did not complete in time
+        self.no_new_data = 0
+        # I2C errors
+        self.com_fail = 0
+        # OK, W_NO_NEW_DATA or E_COM_FAIL of the latest measurement
+        self.last_status = None
+
+    def record(self, status):
+        """Count a measurement outcome and return it."""
+        if status == OK:
+            self.ok += 1
+        elif status == E_COM_FAIL:
+            self.com_fail += 1
+        else:
+            self.no_new_data += 1
+        self.last_status = status
+        return status
+
+
+class RawFrameBuffer:
+    """Fixed-size ring buffer of raw BME680 field blocks.
+
+    Once full, the oldest frame is overwritten.
+
+    """
+
+    def __init__(self, depth):  # noqa D107
+        self.depth = depth
+        self.buffer = bytearray(depth * FIELD_LENGTH)
+        view = memoryview(self.buffer)
+        # One view per slot, created once so frames are stored without allocating
+        self.frames = [view[i * FIELD_LENGTH:(i + 1) * FIELD_LENGTH] for i in range(depth)]
+        # Slot the next frame is written to
+        self.head = 0
+        # Number of buffered frames
+        self.count = 0
+
+    def push(self, field):
+        """Copy a raw field block into the next slot."""
+        frame = self.frames[self.head]
+        for i in range(FIELD_LENGTH):
+            frame[i] = field[i]
+        self.head = (self.head + 1) % self.depth
+        if self.count < self.depth:
+            self.count += 1
+
+    def get(self, index):
+        """Get a buffered frame, 0 being the oldest."""
+        return self.frames[(self.head - self.count + index) % self.depth]
+
+    def latest(self):
+        """Get the most recent frame."""
+        return self.frames[(self.head - 1) % self.depth]
+
+    def clear(self):
+        """Drop all buffered frames."""
+        self.count = 0
+
+    def to_bytes(self):
+        """Get the buffered frames oldest first, FIELD_LENGTH bytes each."""
+        data = bytearray(self.count * FIELD_LENGTH)
+        for i in range(self.count):
+            data[i * FIELD_LENGTH:(i + 1) * FIELD_LENGTH] = self.get(i)
+        return bytes(data)
+
+
 class CalibrationData:
     """Structure for storing BME680 calibration data."""
 
+    __slots__ = ('par_h1', 'par_h2', 'par_h3', 'par_h4', 'par_h5', 'par_h6', 'par_h7',
+                 'par_gh1', 'par_gh2', 'par_gh3',
+                 'par_t1', 'par_t2', 'par_t3',
+                 'par_p1', 'par_p2', 'par_p3', 'par_p4', 'par_p5',
+                 'par_p6', 'par_p7', 'par_p8', 'par_p9', 'par_p10',
+                 't_fine', 'res_heat_range', 'res_heat_val', 'range_sw_err')
+
     def __init__(self):  # noqa D107
         self.par_h1 = None
         self.par_h2 = None
@@ -352,6 +541,15 @@ class CalibrationData:
         self.res_heat_val = heat_value
         self.range_sw_err = (sw_error & RSERROR_MSK) // 16
 
+    def to_bytes(self):
+        """Pack the decoded coefficients, see CALIB_CACHE_FMT."""
+        return struct.pack(CALIB_CACHE_FMT, *[getattr(self, name) for name in CALIB_CACHE_FIELDS])
+
+    def set_from_bytes(self, data):
+        """Set parameters from coefficients packed by to_bytes()."""
+        for name, value in zip(CALIB_CACHE_FIELDS, struct.unpack(CALIB_CACHE_FMT, data)):
+            setattr(self, name, value)
+
 
 class TPHSettings:
     """Structure for storing BME680 sensor settings.
@@ -360,6 +558,8 @@ class TPHSettings:
 
     """
 
+    __slots__ = ('os_hum', 'os_temp', 'os_pres', 'filter')
+
     def __init__(self):  # noqa D107
         # Humidity oversampling
         self.os_hum = None
@@ -374,6 +574,8 @@ class TPHSettings:
 class GasSettings:
     """Structure for storing BME680 gas settings and status."""
 
+    __slots__ = ('nb_conv', 'heatr_ctrl', 'run_gas', 'heatr_temp', 'heatr_dur')
+
     def __init__(self):  # noqa D107
         # Variable to store nb conversion
         self.nb_conv = None
@@ -387,6 +589,47 @@ class GasSettings:
         self.heatr_dur = None
 
 
+class SensorConfig:
+    """Declarative BME680 configuration.
+
+    Applied by BME680.configure() as a single multi-register write.
+    Heater temperature and duration are only programmed when both are given.
+
+    channels is the measurement plan: channels left out are not converted
+    (oversampling OS_NONE, gas measurement and heater off) and not decoded.
+
+    heater_profiles is an optional list of up to ten (temperature, duration)
+    tuples. They are programmed into profiles 0..n-1 and BME680.trigger()
+    then cycles through them, starting at nb_conv. It takes precedence over
+    heatr_temp and heatr_dur.
+
+    """
+
+    def __init__(self, os_hum=OS_2X, os_pres=OS_4X, os_temp=OS_8X, filter=FILTER_SIZE_3,
+                 run_gas=ENABLE_GAS_MEAS, heater=ENABLE_HEATER, nb_conv=0,
+                 heatr_temp=None, heatr_dur=None, channels=CHANNELS_ALL,
+                 heater_profiles=None):  # noqa D107
+        # Humidity, pressure and temperature oversampling
+        self.os_hum = os_hum
+        self.os_pres = os_pres
+        self.os_temp = os_temp
+        # Filter coefficient
+        self.filter = filter
+        # Run gas value, ENABLE_GAS_MEAS selects the one matching the variant
+        self.run_gas = run_gas
+        # ENABLE_HEATER or DISABLE_HEATER
+        self.heater = heater
+        # Heater profile used for conversions
+        self.nb_conv = nb_conv
+        # Heater target in degrees celsius and duration in milliseconds for nb_conv
+        self.heatr_temp = heatr_temp
+        self.heatr_dur = heatr_dur
+        # CHANNEL_* flags of the channels the caller needs
+        self.channels = channels
+        # (temperature, duration) per heater profile, cycled across triggers
+        self.heater_profiles = heater_profiles
+
+
 class BME680Data:
     """Structure to represent BME680 device."""
 
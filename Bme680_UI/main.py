@@ -1,9 +1,19 @@
 from machine import I2C, UART  # Import hardware interfaces for I2C and UART communication
+import gc
+import utime
+# Time and RAM taken by importing the BME680 driver, printed once at boot
+gc.collect()
+_import_mem = gc.mem_alloc()
+_import_start = utime.ticks_ms()
 from usr.bmedriver import BME680
+from usr.constants import SensorConfig
+_import_ms = utime.ticks_diff(utime.ticks_ms(), _import_start)
+gc.collect()
+_import_mem = gc.mem_alloc() - _import_mem
+from usr.air_quality import AirQuality
 import utime as time  # Import time functions with alias
 import osTimer
 from misc import Power
-import utime
 
 
 class DeviceState:
@@ -12,6 +22,7 @@ class DeviceState:
         self.CurrentHum = 0.0
         self.Pressure = 0.0
         self.Lux = 0.0  
+        self.AirQuality = None
         self.SensorInterval = 5000
 
 device_state = DeviceState()
@@ -26,15 +37,24 @@ def uart_print(msg):
 def get_PTH():
     """Read BME680 bme data and apply coefficients to temperature, humidity, and pressure"""
     try:
-        data_ready = bme.get_sensor_data()
+        # Pick up the conversion started on the previous tick, then start the
+        # next one so the timer callback never waits on the sensor.
+        data_ready = bme.collect()
+        bme.trigger()
         if data_ready:
-            device_state.CurrentTemp = bme.data.temperature
-            device_state.CurrentHum = bme.data.humidity 
-            device_state.Pressure = bme.data.pressure 
+            data = bme.data  # One record per measurement, safe to keep reading
+            device_state.CurrentTemp = data.temperature
+            device_state.CurrentHum = data.humidity 
+            device_state.Pressure = data.pressure 
             
             uart_print("Temperature:{:.2f},Humidity:{:.2f},Pressure:{:.2f}".format(device_state.CurrentTemp, device_state.CurrentHum,device_state.Pressure))
+
+            # None until the gas baseline has burnt in
+            device_state.AirQuality = air_quality.update(data)
+            if device_state.AirQuality is not None:
+                uart_print("AirQuality:{:.1f}".format(device_state.AirQuality))
         else:
-            print("BME680 - Data not ready")
+            print("BME680 - Data not ready (ok:{} timeouts:{} bus errors:{})".format(bme.stats.ok, bme.stats.no_new_data, bme.stats.com_fail))
     except Exception as e:
         print("[ERROR] Failed to read bme values:{}".format(e))
 
@@ -43,8 +63,10 @@ def data_check(args):
 
 uart1 = UART(UART.UART1, 115200, 8, 0, 1, 0)
 i2c_dev = I2C(0,fastmode = True)
-bme = BME680(i2c_dev)
-bme.initialize_bme()
+bme = BME680(i2c_dev, config=SensorConfig(heatr_temp=320, heatr_dur=150))
+print("BME680 driver import: {} ms, {} bytes RAM".format(_import_ms, _import_mem))
+bme.trigger()
+air_quality = AirQuality()
 
 Sensor_timer = osTimer()
 Sensor_timer.start(device_state.SensorInterval, 1, data_check)
@@ -72,6 +94,7 @@ while True:
 
                 elif text == "restartDevice":
                     uart_print("Restarting device...")
+                    air_quality.save()
                     Power.powerRestart()
                 else:
                     uart_print("Unknown command: {}".format(text))
@@ -29,3 +29,67 @@ ALS_SD = 0  # Shutdown
 ALS_INT_EN = 1
 ALS_SM = 12
 ALS_IT = 6
+ALS_PERS = 4
+ALS_GAIN = 11
+
+# Persistence: consecutive out-of-threshold conversions before an interrupt
+PERS_1 = 0x0
+PERS_2 = 0x1
+PERS_4 = 0x2
+PERS_8 = 0x3
+
+# Power saving (P_SM register): PSM_EN bit and the PSM mode field
+PSM_EN = 0
+PSM = 1
+PSM_MODE_1 = 0x0
+PSM_MODE_2 = 0x1
+PSM_MODE_3 = 0x2
+PSM_MODE_4 = 0x3
+# Wait between conversions in ms, indexed by PSM mode
+PSM_WAIT_MS = (500, 1000, 2000, 4000)
+# From this sampling interval on the sensor is shut down between samples
+# instead of running a power saving mode
+SHUTDOWN_MIN_INTERVAL_MS = 10000
+
+# ALS_IF flags (bit positions), cleared when ALS_IF is read
+ALS_IF_HIGH = 14
+ALS_IF_LOW = 15
+
+# Threshold tracking: the window around the latest reading, as a fraction
+# of its counts and at least THRESHOLD_MIN_COUNTS wide on each side
+THRESHOLD_BAND = 0.1
+THRESHOLD_MIN_COUNTS = 2
+
+# Lux per count at gain x2 and 800 ms (datasheet); the other settings
+# scale it by gain and integration time
+RESOLUTION_GAIN_2_IT_800MS = 0.0042
+
+# Vishay correction polynomial for the non-linear response at high lux,
+# coefficients from the 4th power down. It was fitted at the low gains only,
+# so it is applied at these and nowhere else
+NONLINEAR_COEFFS = (6.0135e-13, -9.3924e-9, 8.1488e-5, 1.0023)
+NONLINEAR_GAINS = (GAIN_1_8, GAIN_1_4)
+
+# Allowance on top of the integration time for the first conversion
+# after enabling or reconfiguring to complete, in ms
+CONVERSION_MARGIN_MS = 5
+
+# Auto-ranging, in the order Vishay recommends stepping through them: the
+# gain goes up at 100 ms first, then the integration time. Bright light
+# steps the integration time down at the lowest gain.
+AUTO_RANGE_STEPS = (
+    (GAIN_1_8, IT_25MS),
+    (GAIN_1_8, IT_50MS),
+    (GAIN_1_8, IT_100MS),
+    (GAIN_1_4, IT_100MS),
+    (GAIN_1, IT_100MS),
+    (GAIN_2, IT_100MS),
+    (GAIN_2, IT_200MS),
+    (GAIN_2, IT_400MS),
+    (GAIN_2, IT_800MS),
+)
+# Counts that keep the current range; outside of them the sensor is re-ranged
+AUTO_RANGE_LOW = 100
+AUTO_RANGE_HIGH = 10000
+# Counts aimed for when re-ranging, with margin above AUTO_RANGE_LOW
+AUTO_RANGE_TARGET = 200
@@ -1,14 +1,23 @@
 # lis3dh_drv.py
 from machine import I2C
+import ustruct as struct
 
 class LIS3DH:
     WHO_AM_I_REG = 0x0F
     WHO_AM_I_VAL = 0x33
     ADDR_LIST = [0x18, 0x19]
+    # OUT_X_L with the MSB set, so the address auto-increments over the six
+    # output registers (X, Y, Z, low byte first) in a single read
+    OUT_XYZ_REG = 0x28 | 0x80
+    # m/s^2 per LSB in high resolution mode (1 mg/LSB)
+    MS2_PER_LSB = 0.001 * 9.80665
 
     def __init__(self, i2c):
         self.i2c = i2c
         self.addr = None
+        # Preallocated buffers for read_axes_ms2()
+        self._xyz_reg = bytearray([self.OUT_XYZ_REG])
+        self._xyz_buf = bytearray(6)
         self._detect()
         self._init_sensor()
 
@@ -44,28 +53,24 @@ class LIS3DH:
 
     def _init_sensor(self):
         self._write_reg(0x20, 0x57)  # CTRL_REG1: 50 Hz, enable axes
-        self._write_reg(0x23, 0x08)  # CTRL_REG4: high resolution
+        self._write_reg(0x23, 0x88)  # CTRL_REG4: block data update, high resolution
 
     # ─────────────────────────────────────────────
     # Public API
 
-    @staticmethod
-    def _twos_complement(val, bits):
-        if val & (1 << (bits - 1)):
-            val -= 1 << bits
-        return val
-
     def read_axes_ms2(self):
-        scale = 0.001  # g/LSB
         try:
-            axes = []
-            for reg in (0x28, 0x2A, 0x2C):
-                l = self._read_reg(reg)
-                h = self._read_reg(reg + 1)
-                raw = (h << 8) | l
-                raw = self._twos_complement(raw, 16)
-                raw >>= 4
-                axes.append(raw * scale * 9.80665)
-            return tuple(axes)
+            # One auto-increment read of OUT_X_L..OUT_Z_H; with block data
+            # update set, all three axes come from the same output sample
+            # QuecPython returns -1 on a bus error instead of raising, and the
+            # buffer would still hold the previous sample
+            if self.i2c.write(self.addr, b'', 0, self._xyz_reg, 1) == -1:
+                return (0.0, 0.0, 9.80665)
+            if self.i2c.read(self.addr, b'', 0, self._xyz_buf, 6, 0) == -1:
+                return (0.0, 0.0, 9.80665)
+            x, y, z = struct.unpack_from('<hhh', self._xyz_buf)
+            # 12-bit values, left aligned
+            scale = self.MS2_PER_LSB
+            return ((x >> 4) * scale, (y >> 4) * scale, (z >> 4) * scale)
         except Exception:
             return (0.0, 0.0, 9.80665)
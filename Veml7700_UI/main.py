@@ -21,9 +21,12 @@ def uart_print(msg):
 
 def get_lux():
     try:
+        # Only read and report the light level when it left the threshold window
+        if not veml.crossed():
+            return device_state.Lux
         device_state.Lux = veml.lux()
         print("VEML7700 - Light Intensity: {} lux".format(device_state.Lux))
-        uart_print("VEML7700 - Light Intensity : {:.2f} lux".format( veml.lux()))
+        uart_print("VEML7700 - Light Intensity : {:.2f} lux".format(device_state.Lux))
         return device_state.Lux
     except Exception as e:
         print("Error reading Lux:{}".format(e))
@@ -35,7 +38,10 @@ def data_check(args):
 
 uart1 = UART(UART.UART1, 115200, 8, 0, 1, 0)
 i2c_dev = I2C(0,fastmode = True)
-veml=VEML7700(i2c_dev)
+veml=VEML7700(i2c_dev, auto_range=True)
+veml.power_save(device_state.SensorInterval)
+device_state.Lux = veml.track()
+uart_print("VEML7700 - Light Intensity : {:.2f} lux".format(device_state.Lux))
 
 
 Sensor_timer = osTimer()
@@ -55,6 +61,7 @@ while True:
                 if text.startswith("SET_INTERVAL:"):
                     Interval = int(text.split(":", 1)[1])
                     device_state.SensorInterval = Interval * 1000
+                    veml.power_save(device_state.SensorInterval)
                     uart_print("Interval set to {}s".format(Interval))
                     if Sensor_timer is not None:
                         Sensor_timer.stop()              # stop old one safely
@@ -1,10 +1,19 @@
 from machine import I2C, UART  # Import hardware interfaces for I2C and UART communication
+import gc
+import utime
+# Time and RAM taken by importing the BME680 driver, printed once at boot
+gc.collect()
+_import_mem = gc.mem_alloc()
+_import_start = utime.ticks_ms()
 from usr.bmedriver import BME680
+from usr.constants import SensorConfig, CHANNEL_TEMPERATURE, CHANNEL_PRESSURE, CHANNEL_HUMIDITY
+_import_ms = utime.ticks_diff(utime.ticks_ms(), _import_start)
+gc.collect()
+_import_mem = gc.mem_alloc() - _import_mem
 from usr.veml_7700_driver import VEML7700 # Import SHT40 temperature/humidity sensor driver
 import utime as time  # Import time functions with alias
 import osTimer
 from misc import Power
-import utime
 
 class DeviceState:
     def __init__(self):
@@ -26,16 +35,20 @@ def uart_print(msg):
 def get_PTH():
     """Read BME680 bme data and apply coefficients to temperature, humidity, and pressure"""
     try:
-        data_ready = bme.get_sensor_data()
+        # Pick up the conversion started on the previous tick, then start the
+        # next one so the timer callback never waits on the sensor.
+        data_ready = bme.collect()
+        bme.trigger()
         if data_ready:
             device_state.Lux = veml.lux()
-            device_state.CurrentTemp = bme.data.temperature
-            device_state.CurrentHum = bme.data.humidity 
-            device_state.Pressure = bme.data.pressure 
+            data = bme.data  # One record per measurement, safe to keep reading
+            device_state.CurrentTemp = data.temperature
+            device_state.CurrentHum = data.humidity 
+            device_state.Pressure = data.pressure 
             
             uart_print("T:{:.2f},H:{:.2f},P:{:.2f},L:{:.2f}".format(device_state.CurrentTemp, device_state.CurrentHum,device_state.Pressure,device_state.Lux))
         else:
-            print("BME680 - Data not ready")
+            print("BME680 - Data not ready (ok:{} timeouts:{} bus errors:{})".format(bme.stats.ok, bme.stats.no_new_data, bme.stats.com_fail))
     except Exception as e:
         print("[ERROR] Failed to read bme values:{}".format(e))
 
@@ -44,9 +57,11 @@ def data_check(args):
 
 uart1 = UART(UART.UART1, 115200, 8, 0, 1, 0)
 i2c_dev = I2C(0,fastmode = True)
-veml=VEML7700(i2c_dev)
-bme = BME680(i2c_dev)
-bme.initialize_bme()
+veml=VEML7700(i2c_dev, auto_range=True)
+veml.power_save(device_state.SensorInterval)
+bme = BME680(i2c_dev, config=SensorConfig(channels=CHANNEL_TEMPERATURE | CHANNEL_PRESSURE | CHANNEL_HUMIDITY))
+print("BME680 driver import: {} ms, {} bytes RAM".format(_import_ms, _import_mem))
+bme.trigger()
 
 Sensor_timer = osTimer()
 Sensor_timer.start(device_state.SensorInterval, 1, data_check)
@@ -65,6 +80,7 @@ while True:
                 if text.startswith("SET_INTERVAL:"):
                     Interval = int(text.split(":", 1)[1])
                     device_state.SensorInterval = Interval * 1000
+                    veml.power_save(device_state.SensorInterval)
                     uart_print("Interval set to {}s".format(Interval))
                     if Sensor_timer is not None:
                         Sensor_timer.stop()              # stop old one safely
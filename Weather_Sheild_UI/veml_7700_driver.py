@@ -2,18 +2,59 @@ from machine import I2C
 import utime
 import usr.veml7700_registers as reg
 
+# Gain in eighths and integration time in ms, indexed by register setting
+_GAIN_EIGHTHS = (16, 8, 1, 2)
+_IT_MS = (100, 200, 400, 800, None, None, None, None, 50, None, None, None, 25, None, None, None)
+
+# Lux per count for every (gain, integration time) pair, indexed by
+# gain << 4 | integration time setting
+_RESOLUTION = tuple(
+    reg.RESOLUTION_GAIN_2_IT_800MS * (16 * 800) / (_GAIN_EIGHTHS[index >> 4] * _IT_MS[index & 0xF])
+    if _IT_MS[index & 0xF] else None
+    for index in range(4 << 4))
+
+# Full scale of the sensor: a saturated count at the least sensitive setting
+_MAX_LUX = 0xFFFF * _RESOLUTION[(reg.GAIN_1_8 << 4) | reg.IT_25MS]
+
+# ALS_CONF fields whose change restarts the conversion
+_RESTART_MASK = (0x3 << reg.ALS_GAIN) | (0xF << reg.ALS_IT) | (1 << reg.ALS_SD)
+
+# Relative sensitivity of each reg.AUTO_RANGE_STEPS entry
+_RANGE_SENSITIVITY = tuple(_GAIN_EIGHTHS[gain] * _IT_MS[it] for gain, it in reg.AUTO_RANGE_STEPS)
+
 class VEML7700:
-    def __init__(self, i2c_bus, address=0x10):
+    def __init__(self, i2c_bus, address=0x10, auto_range=False, correct_nonlinearity=False):
         self.i2c = i2c_bus
         self.addr = address
         self._gain = reg.GAIN_1_8
         self._integration_time = reg.IT_25MS
+        # ticks_ms deadline of the first conversion after a configuration
+        # change, None once it has completed
+        self._ready_at = None
+        # With auto_range, lux() moves through reg.AUTO_RANGE_STEPS, starting
+        # from the least sensitive step, which is the default setting above
+        self.auto_range = auto_range
+        self._range_step = 0
+        # Apply the high-lux correction at the gains in reg.NONLINEAR_GAINS
+        self.correct_nonlinearity = correct_nonlinearity
+        # Shadow of ALS_CONF, None until the first write
+        self._conf = None
+        # Threshold window around the latest reading as a fraction of its
+        # counts, None while threshold tracking is off, see track()
+        self.threshold_band = None
+        # Sampling interval set by power_save(), None while it is off
+        self._sample_interval = None
+        # P_SM wanted by power_save() and the value on the sensor, which is
+        # 0 while a conversion restart is pending, see configure()
+        self._psm = 0
+        self._psm_written = 0
+        # True when the sensor is shut down between samples
+        self._shutdown_between = False
 
-        self._write_u16(reg.ALS_CONF, 0x0003)
-        self.set_gain(self._gain)
-        self.set_integration_time(self._integration_time)
-        self.enable()
-        self._read_u16(reg.ID)
+        # Powers the sensor up in the same write; lux() waits for the first
+        # conversion if it is called before that completes
+        self.configure(gain=self._gain, integration_time=self._integration_time,
+                       persistence=reg.PERS_1, interrupt=False, shutdown=False)
 
     def _read_u16(self, register):
         r_data = bytearray(2)
@@ -30,30 +71,141 @@ class VEML7700:
         except:
             pass
 
+    def configure(self, gain=None, integration_time=None, persistence=None, interrupt=None, shutdown=None):
+        # Update the given ALS_CONF fields in the shadow and commit them in a
+        # single write, skipped when nothing changed. None keeps a field.
+        old = self._conf
+        conf = old if old is not None else 0
+        if gain is not None:
+            conf = (conf & ~(0x3 << reg.ALS_GAIN)) | (gain << reg.ALS_GAIN)
+            self._gain = gain
+        if integration_time is not None:
+            conf = (conf & ~(0xF << reg.ALS_IT)) | (integration_time << reg.ALS_IT)
+            self._integration_time = integration_time
+        if persistence is not None:
+            conf = (conf & ~(0x3 << reg.ALS_PERS)) | (persistence << reg.ALS_PERS)
+        if interrupt is not None:
+            conf &= ~(1 << reg.ALS_INT_EN)
+            if interrupt:
+                conf |= 1 << reg.ALS_INT_EN
+        if shutdown is not None:
+            conf &= ~(1 << reg.ALS_SD)
+            if shutdown:
+                conf |= 1 << reg.ALS_SD
+        if conf == old:
+            return
+
+        restart = old is None or (conf ^ old) & _RESTART_MASK
+        if restart:
+            # In a power saving mode the first result with the new settings
+            # could come a full wait time later, so convert continuously
+            # until it is in, see _resume_power_saving()
+            self._write_psm(0)
+        self._write_u16(reg.ALS_CONF, conf)
+        self._conf = conf
+        if restart:
+            self._config_changed()
+        if integration_time is not None and self._sample_interval is not None:
+            # The refresh time of a power saving mode includes the integration time
+            self._fit_power_saving()
+
+    def power_save(self, interval_ms):
+        # Match the sensor's duty cycle to a sampling interval in ms, None to
+        # convert continuously. Long intervals shut the sensor down between
+        # samples; lux() then wakes it and waits for the first conversion.
+        # Otherwise the longest power saving mode whose refresh time fits
+        # the interval is used, so the latest result is never older than one
+        # interval. Threshold tracking needs continuous conversions and only
+        # gets the power saving modes.
+        self._sample_interval = interval_ms
+        self._fit_power_saving()
+
+    def _fit_power_saving(self):
+        interval = self._sample_interval
+        shutdown = (interval is not None and interval >= reg.SHUTDOWN_MIN_INTERVAL_MS
+                    and self.threshold_band is None)
+        psm = 0
+        if interval is not None and not shutdown:
+            it_ms = _IT_MS[self._integration_time]
+            for mode in range(len(reg.PSM_WAIT_MS) - 1, -1, -1):
+                if it_ms + reg.PSM_WAIT_MS[mode] <= interval:
+                    psm = (mode << reg.PSM) | (1 << reg.PSM_EN)
+                    break
+        self._psm = psm
+        if self._ready_at is None:
+            self._write_psm(psm)
+        if shutdown != self._shutdown_between:
+            self._shutdown_between = shutdown
+            self.configure(shutdown=shutdown)
+
+    def _write_psm(self, psm):
+        if psm != self._psm_written:
+            self._write_u16(reg.P_SM, psm)
+            self._psm_written = psm
+
+    def _resume_power_saving(self):
+        # Restore the power saving mode suspended by configure() once the
+        # first conversion with the new settings is in
+        if self._ready_at is None:
+            self._write_psm(self._psm)
+
     def enable(self):
-        config_before = self._read_u16(reg.ALS_CONF)
-        config_enabled = config_before & 0xFFFE
-        self._write_u16(reg.ALS_CONF, config_enabled)
-        utime.sleep_ms(150)
+        self.configure(shutdown=False)
 
     def disable(self):
-        config = self._read_u16(reg.ALS_CONF)
-        config |= (1 << 0)
-        self._write_u16(reg.ALS_CONF, config)
+        self.configure(shutdown=True)
 
     def set_gain(self, gain):
-        config = self._read_u16(reg.ALS_CONF)
-        config &= ~(0x3 << 11)
-        config |= (gain << 11)
-        self._write_u16(reg.ALS_CONF, config)
-        self._gain = gain
+        self.configure(gain=gain)
 
     def set_integration_time(self, it):
-        config = self._read_u16(reg.ALS_CONF)
-        config &= ~(0xF << 6)
-        config |= (it << 6)
-        self._write_u16(reg.ALS_CONF, config)
-        self._integration_time = it
+        self.configure(integration_time=it)
+
+    def _config_changed(self):
+        # ALS keeps the result of the old settings until the first
+        # conversion with the new ones completes
+        delay = _IT_MS[self._integration_time] + reg.CONVERSION_MARGIN_MS
+        self._ready_at = utime.ticks_add(utime.ticks_ms(), delay)
+
+    def ready(self):
+        # True once ALS holds a conversion made with the current settings
+        if self._ready_at is None:
+            return True
+        if utime.ticks_diff(self._ready_at, utime.ticks_ms()) > 0:
+            return False
+        self._ready_at = None
+        self._resume_power_saving()
+        return True
+
+    def track(self, band=reg.THRESHOLD_BAND, persistence=reg.PERS_2):
+        # Report-on-crossing mode: every lux() reading moves the ALS_WL and
+        # ALS_WH thresholds around its counts, so crossed() only has to read
+        # ALS_IF to tell whether the light changed by more than band
+        self.threshold_band = band
+        self.configure(interrupt=True, persistence=persistence)
+        if self._sample_interval is not None:
+            self._fit_power_saving()
+        return self.lux()
+
+    def untrack(self):
+        self.threshold_band = None
+        self.configure(interrupt=False)
+        if self._sample_interval is not None:
+            self._fit_power_saving()
+
+    def crossed(self):
+        # Reads, and so clears, ALS_IF. Always True while tracking is off
+        if self.threshold_band is None:
+            return True
+        flags = self._read_u16(reg.ALS_IF)
+        return (flags & ((1 << reg.ALS_IF_HIGH) | (1 << reg.ALS_IF_LOW))) != 0
+
+    def _arm_thresholds(self, als_raw):
+        delta = max(int(als_raw * self.threshold_band), reg.THRESHOLD_MIN_COUNTS)
+        self._write_u16(reg.ALS_WL, max(als_raw - delta, 0))
+        self._write_u16(reg.ALS_WH, min(als_raw + delta, 0xFFFF))
+        # Drop flags raised against the previous window
+        self._read_u16(reg.ALS_IF)
 
     def get_als(self):
         return self._read_u16(reg.ALS)
@@ -71,18 +223,64 @@ class VEML7700:
             reg.IT_800MS: 800
         }
 
+    def _wait_conversion(self):
+        # The sensor converts continuously, so ALS always holds the latest
+        # result; only wait for the first one after a configuration change
+        if self._ready_at is not None:
+            remaining = utime.ticks_diff(self._ready_at, utime.ticks_ms())
+            if remaining > 0:
+                utime.sleep_ms(remaining)
+            self._ready_at = None
+
+    def _read_auto_range(self):
+        # Re-range while the counts are outside the valid window, one
+        # conversion per new range. The range is kept for the next call.
+        steps = reg.AUTO_RANGE_STEPS
+        for _ in range(len(steps)):
+            als_raw = self.get_als()
+            if reg.AUTO_RANGE_LOW <= als_raw <= reg.AUTO_RANGE_HIGH:
+                break
+            step = self._pick_range_step(als_raw)
+            if step == self._range_step:
+                break
+            self._range_step = step
+            gain, it = steps[step]
+            self.configure(gain=gain, integration_time=it)
+            self._wait_conversion()
+        return als_raw
+
+    def _pick_range_step(self, als_raw):
+        # Scale the counts to every step and take the least sensitive one that
+        # reaches AUTO_RANGE_TARGET. A saturated reading is a lower bound,
+        # which still points at the right direction.
+        sensitivity = _RANGE_SENSITIVITY
+        target = reg.AUTO_RANGE_TARGET * sensitivity[self._range_step]
+        counts = max(als_raw, 1)
+        for step in range(len(sensitivity)):
+            if counts * sensitivity[step] >= target:
+                return step
+        return len(sensitivity) - 1
+
     def lux(self):
-        utime.sleep_ms(self.integration_time_values()[self._integration_time])
-        als_raw = self.get_als()
-
-        gain_factor = {
-            reg.GAIN_2: 2,
-            reg.GAIN_1: 1,
-            reg.GAIN_1_4: 0.25,
-            reg.GAIN_1_8: 0.125,
-        }[self._gain]
-
-        integration_time_ms = self.integration_time_values()[self._integration_time]
-        lux = (als_raw / gain_factor) * (10 / integration_time_ms)
+        if self._shutdown_between:
+            # Waking up restarts the conversion, which _wait_conversion() awaits
+            self.configure(shutdown=False)
+        self._wait_conversion()
+        if self.auto_range:
+            als_raw = self._read_auto_range()
+        else:
+            als_raw = self.get_als()
+        self._resume_power_saving()
+        if self._shutdown_between:
+            self.configure(shutdown=True)
+        if self.threshold_band is not None:
+            self._arm_thresholds(als_raw)
+
+        lux = als_raw * _RESOLUTION[(self._gain << 4) | self._integration_time]
+        if self.correct_nonlinearity and self._gain in reg.NONLINEAR_GAINS:
+            # Applied over the whole range, so the output has no step, and
+            # kept within what the sensor can measure
+            c4, c3, c2, c1 = reg.NONLINEAR_COEFFS
+            lux = min((((c4 * lux + c3) * lux + c2) * lux + c1) * lux, _MAX_LUX)
 
         return lux
@@ -0,0 +1,243 @@
+"""Benchmark bmedriver.BME680 on CPython against a simulated BME680.
+
+Runs init, get_sensor_data, heater configuration, BME688 parallel reads and
+every _calc_* routine against bme680_sim and reports per call:
+
+    wall_us                host time spent in the driver, best of ROUNDS rounds
+    device_ms              simulated time, i.e. sleeps and conversion waits
+    i2c_transactions       I2C reads and writes
+    i2c_bytes              bytes on the bus, register addresses included
+    alloc_peak_bytes       largest heap use above the starting point (tracemalloc)
+    alloc_retained_bytes   heap still held afterwards
+
+device_ms and the I2C counts are deterministic, so any change in them is
+real. The allocation figures depend on CPython free lists and garbage
+collector timing, and wall_us depends on the host; a fixed pure Python loop
+is timed alongside (meta.reference_us) and --compare scales by it.
+
+    python tools/bme680_bench.py --output bench.json
+    python tools/bme680_bench.py --compare bench.json
+
+--compare exits with status 1 when a deterministic metric got worse. Changes
+in wall_us beyond --tolerance and allocation changes beyond
+ALLOC_SLACK_BYTES are marked, but do not fail the run.
+
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import bme680_sim as sim
+
+DEFAULT_DRIVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Bme680_UI')
+
+# Timing rounds per benchmark, the fastest one is reported
+ROUNDS = 5
+
+# Metrics that must not grow; the others are only reported
+EXACT_METRICS = ('device_ms', 'i2c_transactions', 'i2c_bytes')
+ALLOC_METRICS = ('alloc_peak_bytes', 'alloc_retained_bytes')
+ALLOC_SLACK_BYTES = 64
+
+
+def reference_workload():
+    """Fixed pure Python work used to normalise wall_us across hosts and runs."""
+    total = 0
+    for i in range(1000):
+        total += (i * 2654435761) >> 7
+    return total
+
+
+def measure(clock, bus, func, repeat):
+    """Run func repeat times, after one warm-up call, and return per-call metrics."""
+    func()
+
+    bus.reset_counters()
+    start_us = clock.us
+    wall = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = time.perf_counter() - start
+        wall = elapsed if wall is None else min(wall, elapsed)
+    calls = repeat * ROUNDS
+    result = {
+        'wall_us': round(wall * 1e6 / repeat, 3),
+        'device_ms': (clock.us - start_us) / 1000.0 / calls,
+        'i2c_transactions': bus.transactions / calls,
+        'i2c_bytes': bus.bytes / calls,
+    }
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    func()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result['alloc_peak_bytes'] = peak - before
+    result['alloc_retained_bytes'] = after - before
+    return result
+
+
+def reference_us(repeat):
+    """Best of ROUNDS timings of reference_workload(), in microseconds per call."""
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            reference_workload()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1e6 / repeat, 3)
+
+
+def measure_parallel(clock, config, repeat):
+    """Metrics of collect_parallel() on a BME688 polled every two heater steps."""
+    from usr import constants
+    from usr.bmedriver import BME680
+
+    bus = sim.SimI2C(sim.SimBME680(clock, variant=constants.VARIANT_HIGH))
+    bme = BME680(bus, calib_cache=None, config=config)
+    bme.start_parallel([(300, 1), (320, 1), (340, 1), (360, 1)], 60)
+
+    def poll():
+        clock.us += 2 * 60000
+        bme.collect_parallel()
+
+    return measure(clock, bus, poll, repeat)
+
+
+def run(driver_dir, repeat):
+    reference_before = reference_us(repeat)
+    clock = sim.install(driver_dir)
+    from usr import bmedriver, constants
+    from usr.bmedriver import BME680
+    from usr.constants import SensorConfig
+
+    def new_bus(**kwargs):
+        return sim.SimI2C(sim.SimBME680(clock, **kwargs))
+
+    results = {}
+
+    bus = new_bus()
+    results['init_cold'] = measure(clock, bus, lambda: BME680(bus, calib_cache=None), repeat)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, 'calib_{:02x}_{:02x}.bin')
+        bus = new_bus()
+        results['init_warm_cache'] = measure(clock, bus, lambda: BME680(bus, calib_cache=cache), repeat)
+
+    tph = SensorConfig(channels=constants.CHANNEL_TEMPERATURE | constants.CHANNEL_PRESSURE |
+                       constants.CHANNEL_HUMIDITY)
+    gas = SensorConfig(heatr_temp=320, heatr_dur=150)
+
+    bus = new_bus()
+    bme = BME680(bus, calib_cache=None, config=tph)
+    results['get_sensor_data_tph'] = measure(clock, bus, bme.get_sensor_data, repeat)
+    bme.configure(gas)
+    results['get_sensor_data_gas'] = measure(clock, bus, bme.get_sensor_data, repeat)
+
+    def two_phase():
+        bme.trigger()
+        clock.us += bme.get_profile_duration() * 1000
+        bme.collect()
+
+    results['trigger_collect_gas'] = measure(clock, bus, two_phase, repeat)
+    results['configure_heater'] = measure(clock, bus, lambda: bme.configure(gas), repeat)
+    results['set_gas_heater_profile'] = measure(clock, bus, lambda: bme.set_gas_heater_profile(320, 150), repeat)
+    results['collect_parallel'] = measure_parallel(clock, tph, repeat)
+
+    for compensation, suffix in ((constants.COMPENSATION_INT, 'int'),
+                                 (constants.COMPENSATION_SMALL_INT, 'small_int')):
+        bus = new_bus()
+        bme = BME680(bus, calib_cache=None, compensation=compensation)
+        calcs = (
+            ('_calc_temperature', (500000,)),
+            ('_calc_pressure', (400000,)),
+            ('_calc_humidity', (20000,)),
+            ('_calc_gas_resistance_low', (500, 5)),
+            ('_calc_gas_resistance_high', (500, 5)),
+        )
+        for name, args in calcs:
+            func = getattr(bme, name)
+            results['{}_{}'.format(name, suffix)] = measure(clock, bus, lambda: func(*args), repeat * 10)
+
+    results['_calc_heater_resistance'] = measure(clock, bus, lambda: bme._calc_heater_resistance(320),
+                                                 repeat * 10)
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'driver_version': bmedriver.__version__,
+            'repeat': repeat,
+            'reference_us': min(reference_before, reference_us(repeat)),
+        },
+        'results': results,
+    }
+
+
+def compare(old, new, tolerance):
+    """Print metric changes from old to new and return the regressions in EXACT_METRICS."""
+    regressions = []
+    # How much slower this host ran the reference workload
+    speed = new['meta']['reference_us'] / old['meta']['reference_us']
+    print('reference workload {} -> {} us, wall_us scaled by {:.2f}'.format(
+        old['meta']['reference_us'], new['meta']['reference_us'], speed))
+    for name, metrics in sorted(new['results'].items()):
+        previous = old['results'].get(name)
+        if previous is None:
+            print('{:40} new'.format(name))
+            continue
+        for metric, value in sorted(metrics.items()):
+            before = previous.get(metric)
+            if before is None or before == value:
+                continue
+            mark = ''
+            if metric in EXACT_METRICS:
+                if value > before:
+                    mark = ' REGRESSION'
+                    regressions.append((name, metric))
+            elif metric == 'wall_us':
+                if value > before * speed * (1 + tolerance):
+                    mark = ' slower'
+            elif metric in ALLOC_METRICS and value > before + ALLOC_SLACK_BYTES:
+                mark = ' more memory'
+            print('{:40} {:22} {:>12} -> {:<12}{}'.format(name, metric, before, value, mark))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--driver-dir', default=DEFAULT_DRIVER_DIR,
+                        help='Folder with bmedriver.py and constants.py')
+    parser.add_argument('--repeat', type=int, default=200, help='Calls per driver operation')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Earlier results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative wall_us increase marked as slower, default 0.2')
+    args = parser.parse_args(argv)
+
+    report = run(args.driver_dir, args.repeat)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    elif not args.compare:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if compare(old, report, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""Vectorized host-side BME680 compensation over NumPy arrays.
+
+Reprocesses raw BME680 ADC values on a PC or server. Results match the
+integer _calc_* routines in bmedriver.py bit for bit, in the same units
+as FieldData: degrees celsius, hPa, % relative humidity and Ohms.
+
+    import numpy as np
+    from bme680_compensate import compensate, unpack_frames
+
+    adc = unpack_frames(open('frames.bin', 'rb').read())
+    out = compensate(calibration, adc['temperature'], adc['pressure'], adc['humidity'],
+                     adc['gas_low'], adc['gas_range_low'])
+
+calibration is a CalibrationData instance, or any object with the same
+par_* / res_heat_* / range_sw_err attributes.
+
+"""
+import numpy as np
+
+VARIANT_LOW = 0x00
+VARIANT_HIGH = 0x01
+
+FIELD_LENGTH = 17
+
+# Same gas range look up tables as constants.py
+LOOKUP_TABLE1 = np.array([2147483647, 2147483647, 2147483647, 2147483647,
+                          2147483647, 2126008810, 2147483647, 2130303777, 2147483647,
+                          2147483647, 2143188679, 2136746228, 2147483647, 2126008810,
+                          2147483647, 2147483647], dtype=np.int64)
+
+LOOKUP_TABLE2 = np.array([4096000000, 2048000000, 1024000000, 512000000,
+                          255744255, 127110228, 64000000, 32258064,
+                          16016016, 8000000, 4000000, 2000000,
+                          1000000, 500000, 250000, 125000], dtype=np.int64)
+
+
+def _i64(values):
+    return np.asarray(values, dtype=np.int64)
+
+
+def unpack_frames(data):
+    """Split packed raw field blocks, as returned by BME680.raw_frames(), into ADC arrays."""
+    frames = np.frombuffer(data, dtype=np.uint8).reshape(-1, FIELD_LENGTH).astype(np.int64)
+    return {
+        'meas_index': frames[:, 1],
+        'gas_index': frames[:, 0] & 0x0f,
+        'pressure': (frames[:, 2] << 12) | (frames[:, 3] << 4) | (frames[:, 4] >> 4),
+        'temperature': (frames[:, 5] << 12) | (frames[:, 6] << 4) | (frames[:, 7] >> 4),
+        'humidity': (frames[:, 8] << 8) | frames[:, 9],
+        'gas_low': (frames[:, 13] << 2) | (frames[:, 14] >> 6),
+        'gas_range_low': frames[:, 14] & 0x0f,
+        'gas_high': (frames[:, 15] << 2) | (frames[:, 16] >> 6),
+        'gas_range_high': frames[:, 16] & 0x0f,
+    }
+
+
+def calc_t_fine(calib, temperature_adc, offset_temp_in_t_fine=0):
+    """Get t_fine, the intermediate temperature used by pressure and humidity compensation."""
+    adc = _i64(temperature_adc)
+    var1 = (adc >> 3) - (calib.par_t1 << 1)
+    var2 = (var1 * calib.par_t2) >> 11
+    var3 = ((var1 >> 1) * (var1 >> 1)) >> 12
+    var3 = (var3 * (calib.par_t3 << 4)) >> 14
+    return (var2 + var3) + offset_temp_in_t_fine
+
+
+def calc_temperature(t_fine):
+    """Temperature in degrees celsius x100, as _calc_temperature()."""
+    return ((t_fine * 5) + 128) >> 8
+
+
+def calc_pressure(calib, t_fine, pressure_adc):
+    """Pressure in Pascal, as _calc_pressure()."""
+    adc = _i64(pressure_adc)
+    var1 = (t_fine >> 1) - 64000
+    var2 = ((((var1 >> 2) * (var1 >> 2)) >> 11) * calib.par_p6) >> 2
+    var2 = var2 + ((var1 * calib.par_p5) << 1)
+    var2 = (var2 >> 2) + (calib.par_p4 << 16)
+    var1 = (((((var1 >> 2) * (var1 >> 2)) >> 13) *
+             (calib.par_p3 << 5)) >> 3) + ((calib.par_p2 * var1) >> 1)
+    var1 = var1 >> 18
+
+    var1 = ((32768 + var1) * calib.par_p1) >> 15
+    calc_pressure = 1048576 - adc
+    calc_pressure = (calc_pressure - (var2 >> 12)) * 3125
+
+    calc_pressure = np.where(calc_pressure >= (1 << 31),
+                             (calc_pressure // var1) << 1,
+                             (calc_pressure << 1) // var1)
+
+    var1 = (calib.par_p9 * (((calc_pressure >> 3) * (calc_pressure >> 3)) >> 13)) >> 12
+    var2 = ((calc_pressure >> 2) * calib.par_p8) >> 13
+    var3 = ((calc_pressure >> 8) * (calc_pressure >> 8) *
+            (calc_pressure >> 8) * calib.par_p10) >> 17
+
+    return calc_pressure + ((var1 + var2 + var3 + (calib.par_p7 << 7)) >> 4)
+
+
+def calc_humidity(calib, t_fine, humidity_adc):
+    """Humidity in % relative humidity x1000, as _calc_humidity()."""
+    adc = _i64(humidity_adc)
+    temp_scaled = ((t_fine * 5) + 128) >> 8
+    var1 = (adc - (calib.par_h1 * 16)) - (((temp_scaled * calib.par_h3) // 100) >> 1)
+    var2 = (calib.par_h2 *
+            (((temp_scaled * calib.par_h4) // 100) +
+             (((temp_scaled * ((temp_scaled * calib.par_h5) // 100)) >> 6) // 100) +
+             (1 * 16384))) >> 10
+    var3 = var1 * var2
+    var4 = calib.par_h6 << 7
+    var4 = (var4 + ((temp_scaled * calib.par_h7) // 100)) >> 4
+    var5 = ((var3 >> 14) * (var3 >> 14)) >> 10
+    var6 = (var4 * var5) >> 1
+    calc_hum = (((var3 + var6) >> 10) * 1000) >> 12
+
+    return np.clip(calc_hum, 0, 100000)
+
+
+def calc_gas_resistance_low(calib, gas_res_adc, gas_range):
+    """Gas resistance in Ohms for variant 0x00, as _calc_gas_resistance_low()."""
+    adc = _i64(gas_res_adc)
+    gas_range = _i64(gas_range)
+    var1 = ((1340 + (5 * calib.range_sw_err)) * LOOKUP_TABLE1[gas_range]) >> 16
+    var2 = ((adc << 15) - 16777216) + var1
+    var3 = (LOOKUP_TABLE2[gas_range] * var1) >> 9
+
+    # Python's int / int is correctly rounded. Below 2**53 the float division
+    # is too; above it, split off the exact integer quotient before dividing.
+    numerator = var3 + (var2 >> 1)
+    quotient, remainder = np.divmod(numerator, var2)
+    calc_gas_res = np.where(np.abs(numerator) < (1 << 53),
+                            numerator.astype(np.float64) / var2,
+                            quotient + remainder / var2)
+
+    return np.where(calc_gas_res < 0, (1 << 32) + calc_gas_res, calc_gas_res)
+
+
+def calc_gas_resistance_high(gas_res_adc, gas_range):
+    """Gas resistance in Ohms for variant 0x01, as _calc_gas_resistance_high()."""
+    var1 = 262144 >> _i64(gas_range)
+    var2 = (_i64(gas_res_adc) - 512) * 3 + 4096
+    return ((10000 * var1) / var2) * 100
+
+
+def compensate(calib, temperature_adc, pressure_adc, humidity_adc,
+               gas_res_adc=None, gas_range=None, variant=VARIANT_LOW, offset_temp_in_t_fine=0):
+    """Compensate arrays of raw readings in one vectorized pass.
+
+    :param calib: CalibrationData or an object with the same attributes
+    :param gas_res_adc: Optional gas ADC values, with gas_range, for the given variant
+    :param offset_temp_in_t_fine: Same as BME680.offset_temp_in_t_fine
+    :return: dict of float64 arrays: temperature, pressure, humidity and gas_resistance
+
+    """
+    t_fine = calc_t_fine(calib, temperature_adc, offset_temp_in_t_fine)
+    result = {
+        'temperature': calc_temperature(t_fine) / 100.0,
+        'pressure': calc_pressure(calib, t_fine, pressure_adc) / 100.0,
+        'humidity': calc_humidity(calib, t_fine, humidity_adc) / 1000.0,
+        'gas_resistance': None,
+    }
+    if gas_res_adc is not None:
+        if variant == VARIANT_HIGH:
+            result['gas_resistance'] = calc_gas_resistance_high(gas_res_adc, gas_range)
+        else:
+            result['gas_resistance'] = calc_gas_resistance_low(calib, gas_res_adc, gas_range)
+    return result
@@ -0,0 +1,73 @@
+"""Compare BME680 compensation implementations on the device.
+
+Copy to the module next to bmedriver.py and constants.py, then run it from the
+REPL. Both implementations are fed the same raw ADC sweep using the chip's
+own calibration. Reports mismatches, the average time per call and heap bytes
+allocated per call.
+
+    import usr.bme680_compensation_check as check
+    check.run(i2c_dev)
+
+"""
+import gc
+import utime
+
+from usr import constants
+from usr.bmedriver import BME680
+
+# Raw ADC sweeps, wide enough to cover the operating range for typical
+# calibration values.
+TEMPERATURE_ADC = range(300000, 700000, 4000)
+PRESSURE_ADC = range(200000, 600000, 4000)
+HUMIDITY_ADC = range(0, 65536, 655)
+GAS_ADC = range(0, 1024, 11)
+
+
+def _time_call(func, args_list):
+    """Return (results, microseconds per call, heap bytes per call)."""
+    results = []
+    for args in args_list:
+        results.append(func(*args))
+    gc.collect()
+    gc.disable()
+    start_mem = gc.mem_alloc()
+    start = utime.ticks_us()
+    for args in args_list:
+        func(*args)
+    elapsed = utime.ticks_diff(utime.ticks_us(), start)
+    allocated = gc.mem_alloc() - start_mem
+    gc.enable()
+    count = len(args_list)
+    return results, elapsed / count, allocated / count
+
+
+def _compare(ref, small, name, args_list):
+    ref_out, ref_us, ref_mem = _time_call(getattr(ref, name), args_list)
+    small_out, small_us, small_mem = _time_call(getattr(small, name), args_list)
+    mismatches = sum(1 for a, b in zip(ref_out, small_out) if a != b)
+    print('{}: {:d} calls, {:d} mismatches, int {:.1f}us {:.1f}B, small int {:.1f}us {:.1f}B'.format(
+        name, len(args_list), mismatches, ref_us, ref_mem, small_us, small_mem))
+
+
+def run(i2c, i2c_addr=constants.I2C_ADDR_PRIMARY):
+    ref = BME680(i2c, i2c_addr, compensation=constants.COMPENSATION_INT)
+    small = BME680(i2c, i2c_addr, compensation=constants.COMPENSATION_SMALL_INT)
+
+    temperature = [(adc,) for adc in TEMPERATURE_ADC]
+    # Pressure and humidity depend on t_fine from the last temperature call
+    pressure = [(adc,) for adc in PRESSURE_ADC]
+    humidity = [(adc,) for adc in HUMIDITY_ADC]
+    gas = [(adc, gas_range) for gas_range in range(16) for adc in GAS_ADC]
+
+    if ref._variant == constants.VARIANT_HIGH:
+        gas_name = '_calc_gas_resistance_high'
+    else:
+        gas_name = '_calc_gas_resistance_low'
+    _compare(ref, small, '_calc_temperature', temperature)
+    _compare(ref, small, gas_name, gas)
+    for adc in (400000, 500000, 600000):
+        ref._calc_temperature(adc)
+        small._calc_temperature(adc)
+        print('t_fine={:d}'.format(ref.calibration_data.t_fine))
+        _compare(ref, small, '_calc_pressure', pressure)
+        _compare(ref, small, '_calc_humidity', humidity)
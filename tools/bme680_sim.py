@@ -0,0 +1,234 @@
+"""In-memory BME680 for running bmedriver.py on CPython.
+
+install() registers stand-ins for the MicroPython modules the driver imports
+(utime on a virtual clock, uerrno, ustruct and micropython) and makes a UI
+folder importable as the usr package, as on the board:
+
+    import bme680_sim as sim
+
+    clock = sim.install('Bme680_UI')
+    from usr.bmedriver import BME680
+
+    bus = sim.SimI2C(sim.SimBME680(clock))
+    bme = BME680(bus, calib_cache=None)
+
+Sleeps advance the virtual clock instead of blocking, so conversions take
+their simulated time without slowing the host down.
+
+"""
+import errno
+import os
+import struct
+import sys
+import types
+
+# Coefficient registers 0x89..0xa1 and 0xe1..0xf0 of a sensor with typical
+# production calibration values
+COEFF_BLOB1 = bytes.fromhex('00cc660300078e5ed75800771b82ff281e000044f3f6f51e00')
+COEFF_BLOB2 = bytes.fromhex('3f5a31002d14789c5566fdcddf120000')
+# res_heat_val (0x00), res_heat_range (0x02) and range_sw_err (0x04)
+HEAT_BLOB = bytes((0x2c, 0x10, 0x30))
+
+# Conversion cycles per oversampling setting, as in constants.OS_TO_MEAS_CYCLES
+_OS_CYCLES = (0, 1, 2, 4, 8, 16, 16, 16)
+
+
+class VirtualClock:
+    """Microsecond clock driven by the utime stand-in."""
+
+    def __init__(self):  # noqa D107
+        self.us = 0
+
+    def ms(self):
+        return self.us // 1000
+
+
+def install(driver_dir, clock=None):
+    """Register the MicroPython stand-ins and map usr to driver_dir.
+
+    :param driver_dir: Folder holding bmedriver.py and constants.py
+    :param clock: Optional VirtualClock to drive
+    :return: The VirtualClock used by utime
+
+    """
+    clock = clock or VirtualClock()
+
+    utime = types.ModuleType('utime')
+    utime.ticks_ms = clock.ms
+    utime.ticks_us = lambda: clock.us
+    utime.ticks_add = lambda ticks, delta: ticks + delta
+    utime.ticks_diff = lambda end, start: end - start
+
+    def sleep_us(us):
+        clock.us += int(us)
+
+    utime.sleep_us = sleep_us
+    utime.sleep_ms = lambda ms: sleep_us(ms * 1000)
+    utime.sleep = lambda seconds: sleep_us(seconds * 1000000)
+
+    uerrno = types.ModuleType('uerrno')
+    uerrno.ENODEV = errno.ENODEV
+
+    micropython = types.ModuleType('micropython')
+    micropython.const = lambda value: value
+
+    usr = types.ModuleType('usr')
+    usr.__path__ = [os.path.abspath(driver_dir)]
+
+    for name in [name for name in sys.modules if name == 'usr' or name.startswith('usr.')]:
+        del sys.modules[name]
+    sys.modules.update({'utime': utime, 'uerrno': uerrno, 'ustruct': struct,
+                        'micropython': micropython, 'usr': usr})
+    return clock
+
+
+class SimBME680:
+    """Register file of one BME680 on the bus.
+
+    Forced-mode conversions complete after the time the oversampling and
+    heater settings call for, or after latency_ms when given. Results come
+    from the adc dict.
+
+    With variant 0x01 the sensor behaves as a BME688: parallel mode steps
+    through the heater profiles and fills the three field blocks in turn.
+
+    :param clock: VirtualClock from install()
+    :param i2c_addr: Bus address
+    :param variant: Value of the variant register 0xF0, 0x01 for a BME688
+    :param latency_ms: Fixed conversion time, None to derive it from the settings
+
+    """
+
+    def __init__(self, clock, i2c_addr=0x76, variant=0x00, latency_ms=None):  # noqa D107
+        self.clock = clock
+        self.i2c_addr = i2c_addr
+        self.latency_ms = latency_ms
+        self.regs = bytearray(256)
+        self.regs[0xd0] = 0x61
+        self.regs[0x89:0x89 + len(COEFF_BLOB1)] = COEFF_BLOB1
+        self.regs[0xe1:0xe1 + len(COEFF_BLOB2)] = COEFF_BLOB2
+        # After the coefficients, whose second block ends on this register
+        self.regs[0xf0] = variant
+        self.regs[0x00], self.regs[0x02], self.regs[0x04] = HEAT_BLOB
+        # Raw ADC values reported by the next conversions
+        self.adc = {'temperature': 500000, 'pressure': 400000, 'humidity': 20000,
+                    'gas': 500, 'gas_range': 5}
+        self._done_at = None
+        self._meas_index = 0
+        # Parallel mode: profile and field block of the next step
+        self._step = 0
+        self._block = 0
+
+    def _tph_us(self):
+        regs = self.regs
+        cycles = (_OS_CYCLES[regs[0x74] >> 5] + _OS_CYCLES[(regs[0x74] >> 2) & 0x07] +
+                  _OS_CYCLES[regs[0x72] & 0x07])
+        return cycles * 1963 + 477 * 9
+
+    def conversion_ms(self):
+        """Time a forced-mode conversion takes with the current settings."""
+        if self.latency_ms is not None:
+            return self.latency_ms
+        regs = self.regs
+        duration = (self._tph_us() + 1000) // 1000 + 1
+        if regs[0x71] & 0x30:
+            gas_wait = regs[0x64 + (regs[0x71] & 0x0f)]
+            duration += (gas_wait & 0x3f) * (1, 4, 16, 64)[gas_wait >> 6]
+        return duration
+
+    def step_ms(self, step):
+        """Time a parallel-mode heater step takes: its multiplier of the shared duration plus the TPH conversion."""
+        shared = self.regs[0x6e]
+        shared_us = (shared & 0x3f) * (1, 4, 16, 64)[shared >> 6] * 477
+        return (self.regs[0x64 + step] * shared_us + self._tph_us() + 999) // 1000
+
+    def _update(self):
+        while self._done_at is not None and self.clock.ms() >= self._done_at:
+            regs = self.regs
+            if regs[0x74] & 0x03 == 0x02:
+                profiles = regs[0x71] & 0x0f or 1
+                self._write_field(0x1d + 17 * self._block, self._step)
+                self._block = (self._block + 1) % 3
+                self._step = (self._step + 1) % profiles
+                self._done_at += self.step_ms(self._step)
+            else:
+                self._done_at = None
+                regs[0x74] &= 0xfc
+                self._write_field(0x1d, regs[0x71] & 0x0f)
+
+    def _write_field(self, base, gas_index):
+        regs = self.regs
+        adc = self.adc
+        regs[base] = 0x80 | gas_index
+        regs[base + 1] = self._meas_index & 0xff
+        self._meas_index += 1
+        for offset, value in ((2, adc['pressure']), (5, adc['temperature'])):
+            regs[base + offset] = (value >> 12) & 0xff
+            regs[base + offset + 1] = (value >> 4) & 0xff
+            regs[base + offset + 2] = (value & 0x0f) << 4
+        regs[base + 8] = adc['humidity'] >> 8
+        regs[base + 9] = adc['humidity'] & 0xff
+        status = 0x30 if regs[0x71] & 0x30 else 0x00
+        for offset in (13, 15):
+            regs[base + offset] = adc['gas'] >> 2
+            regs[base + offset + 1] = ((adc['gas'] & 0x03) << 6) | status | adc['gas_range']
+
+    def read(self, register, length):
+        self._update()
+        return bytes(self.regs[(register + i) & 0xff] for i in range(length))
+
+    def write(self, register, data):
+        """Write data from register on; further bytes come as address/data pairs."""
+        self._update()
+        pairs = [(register, data[0])]
+        pairs += [(data[i], data[i + 1]) for i in range(1, len(data) - 1, 2)]
+        for address, value in pairs:
+            if address == 0xe0 and value == 0xb6:
+                self.regs[0x70:0x76] = bytes(6)
+                self.regs[0x1d] = 0
+                self._done_at = None
+                continue
+            self.regs[address] = value
+            if address == 0x74 and value & 0x03 == 0x01:
+                self.regs[0x1d] &= 0x7f
+                self._done_at = self.clock.ms() + self.conversion_ms()
+            elif address == 0x74 and value & 0x03 == 0x02 and self.regs[0xf0] == 0x01:
+                self._step = 0
+                self._done_at = self.clock.ms() + self.step_ms(0)
+            elif address == 0x74:
+                self._done_at = None
+
+
+class SimI2C:
+    """QuecPython style I2C bus counting transactions and bytes.
+
+    Set fail to True to make every transfer return -1, like a bus error.
+
+    """
+
+    def __init__(self, *devices):  # noqa D107
+        self.devices = {device.i2c_addr: device for device in devices}
+        self.fail = False
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.bytes = 0
+
+    def read(self, addr, regaddr, regaddr_len, buf, length, delay):
+        self.transactions += 1
+        self.bytes += regaddr_len + length
+        device = self.devices.get(addr)
+        if self.fail or device is None:
+            return -1
+        buf[:length] = device.read(regaddr[0], length)
+        return 0
+
+    def write(self, addr, regaddr, regaddr_len, data, length):
+        self.transactions += 1
+        self.bytes += regaddr_len + length
+        device = self.devices.get(addr)
+        if self.fail or device is None:
+            return -1
+        device.write(regaddr[0], bytes(data[:length]))
+        return 0